@@ -0,0 +1,74 @@
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.models import Base, Product, Order, OrderItem, ProfitAdjustment, OrderStatus
+from repository.order_repository import OrderRepository
+
+SEED = 42
+CATEGORIES = ["Жидкости", "Картриджи", "Испарители", "Устройства"]
+SHEET_HEADERS = {"Жидкости": "Смак", "Картриджи": "Опір", "Испарители": "Опір", "Устройства": "Колір"}
+NAMES = ["Mango", "Blueberry Ice", "Cherry Cola", "Watermelon", "Double Apple", "Strawberry Kiwi", "Mint", "Grape"]
+ATTRIBUTES = ["ice", "mint", "sour", "0.8 Ом", "1.0 Ом", "black", "silver", "30 мл"]
+REASONS = ["Скидка постоянному клиенту", "Доставка", "Возврат x1 товара"]
+
+def create_scratch_engine(url: str = "sqlite://") -> Engine:
+    """Engine with the full schema; the default in-memory SQLite is shared by all sessions"""
+    engine = create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False}) \
+        if url == "sqlite://" else create_engine(url)
+    Base.metadata.create_all(engine)
+    return engine
+
+def add_products(session: Session, count: int, rng: random.Random, quantity: Optional[int] = None) -> List[Product]:
+    products = []
+    for i in range(count):
+        price = rng.choice([150, 250, 320, 450, 900])
+        products.append(Product(sheet_name=CATEGORIES[i % len(CATEGORIES)], sheet_row=i + 2,
+                                name=f"{NAMES[i % len(NAMES)]} {i // len(NAMES)}", attribute=ATTRIBUTES[i % len(ATTRIBUTES)],
+                                quantity=rng.randint(0, 50) if quantity is None else quantity, price=price, cost=round(price * 0.6, 2)))
+    session.add_all(products)
+    session.commit()
+    return products
+
+def add_orders(session: Session, products: List[Product], count: int, rng: random.Random, items_per_order: int = 5,
+               days: int = 30, completed_share: float = 0.8) -> None:
+    now = datetime.now()
+    for i in range(count):
+        created_at = now - timedelta(days=rng.uniform(0, days))
+        completed = rng.random() < completed_share
+        order = Order(id=f"{i:08x}", name=f"Клиент {i}", created_at=created_at,
+                      status=OrderStatus.COMPLETED if completed else OrderStatus.PENDING,
+                      completed_at=min(now, created_at + timedelta(hours=rng.uniform(0, 12))) if completed else None)
+        session.add(order)
+
+        for product in rng.sample(products, min(items_per_order, len(products))):
+            session.add(OrderItem(order_id=order.id, product_id=product.id, product_name=product.full_name,
+                                  quantity=rng.randint(1, 3), price=product.price, cost=product.cost))
+        if rng.random() < 0.3:
+            session.add(ProfitAdjustment(order_id=order.id, amount=-rng.choice([50, 100]), reason=rng.choice(REASONS)))
+
+    session.commit()
+    OrderRepository(session).recalculate_totals()
+
+def build_dataset(engine: Engine, products: int = 200, orders: int = 2000, items_per_order: int = 5,
+                  stock: Optional[int] = None) -> Session:
+    """Fill the database with a deterministic catalog and order history, stock is random unless given"""
+    rng = random.Random(SEED)
+    session = sessionmaker(bind=engine)()
+    catalog = add_products(session, products, rng, stock)
+    add_orders(session, catalog, orders, rng, items_per_order)
+    return session
+
+def build_sheets(products: List[Product]) -> Dict[str, List[List[str]]]:
+    """Worksheet rows holding exactly the given catalog, so a sheet sync finds nothing to change"""
+    sheets = {}
+    for product in products:
+        rows = sheets.setdefault(product.sheet_name, [["Товар", SHEET_HEADERS[product.sheet_name], "Кількість", "Ціна", "Собівартість"]])
+        while len(rows) < product.sheet_row:
+            rows.append([])
+        rows[product.sheet_row - 1] = [product.name, product.attribute, str(product.quantity), str(product.price), str(product.cost)]
+    return sheets
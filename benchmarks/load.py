@@ -0,0 +1,318 @@
+"""End-to-end load test: operator scenarios fed through the real Dispatcher with a fake Telegram API and in-memory sheets.
+
+    python -m benchmarks.load --operators 10 --scenarios 500
+    python -m benchmarks.load --db-url postgresql://postgres:@localhost:5432/skull_shop_load --mix complete=1,statistics=1
+"""
+import argparse, asyncio, itertools, logging, os, random, sys, tempfile, time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from repository.sheets import SheetManager
+from repository.sheets_backend import MemoryBackend
+from utils.logging_setup import setup_logging
+
+SCENARIO_WEIGHTS = {"new_order": 3, "add_items": 2, "adjust": 1, "complete": 2, "statistics": 1}
+BOT_TOKEN = "123456:load-test"
+FIRST_CHAT_ID = 100000
+
+def build_fake_session(latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import EditMessageReplyMarkup, EditMessageText, SendDocument, SendMessage
+    from aiogram.types import InlineKeyboardMarkup, Message
+
+    class FakeSession(BaseSession):
+        """Telegram API stand-in answering every request locally and remembering inline keyboards per chat"""
+
+        def __init__(self):
+            super().__init__()
+            self.latency = latency
+            self.calls = Counter()
+            self.message_ids = itertools.count(1)
+            self.keyboards: Dict[int, Tuple[int, InlineKeyboardMarkup]] = {}
+
+        async def make_request(self, bot, method, timeout: Optional[int] = None):
+            self.calls[type(method).__name__] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            if isinstance(method, (SendMessage, SendDocument)):
+                message_id = next(self.message_ids)
+            elif isinstance(method, (EditMessageText, EditMessageReplyMarkup)):
+                message_id = method.message_id
+            else:
+                return True
+
+            chat_id = int(method.chat_id)
+            markup = method.reply_markup if isinstance(method.reply_markup, InlineKeyboardMarkup) else None
+            if markup:
+                self.keyboards[chat_id] = (message_id, markup)
+            elif isinstance(method, EditMessageText) and self.keyboards.get(chat_id, (None,))[0] == message_id:
+                del self.keyboards[chat_id]
+
+            return Message.model_validate({
+                "message_id": message_id, "date": datetime.now(), "chat": {"id": chat_id, "type": "private"},
+                "text": getattr(method, "text", None) or ""
+            }, context={"bot": bot})
+
+        async def close(self):
+            pass
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+    return FakeSession()
+
+class LocalBot:
+    """Dispatcher from bot.py wired to a fake Telegram session and local sheets over the scratch database"""
+
+    def __init__(self, api_latency: float, idempotency_ttl: float, sheets_latency: float = 0, sheets_error_rate: float = 0):
+        from aiogram import Bot
+        from bot import build_dispatcher
+        from benchmarks.data import build_sheets
+        from database.models import Product
+        from database.session import Session, session_factory
+
+        self.session = Session()
+        self.sheets = MemoryBackend(build_sheets(self.session.query(Product).all()), sheets_latency)
+        self.sheet_manager = SheetManager(session_factory, backend=self.sheets)
+        # Like the real bot, startup does not retry, so failures are only injected once it runs
+        self.sheets.error_rate = sheets_error_rate
+        self.sheet_manager.retry_delay = 0
+        self.bot = Bot(token=BOT_TOKEN, session=build_fake_session(api_latency))
+        self.dp = build_dispatcher(self.sheet_manager, idempotency_ttl)
+
+    async def start(self, sync_interval: float):
+        await self.sheet_manager.start_background_tasks(sync_interval)
+
+    async def stop(self):
+        await self.sheet_manager.update_queue.join()
+        await self.dp.emit_shutdown()
+        await self.sheet_manager.stop_background_tasks()
+        self.session.close()
+        await self.bot.session.close()
+
+def use_scratch_database(db_url: Optional[str]) -> Optional[tempfile.TemporaryDirectory]:
+    """Point the bot at the given database or a temporary SQLite file, before database.session creates the engine"""
+    if db_url:
+        os.environ["DB_URL"] = db_url
+        return None
+
+    temp_dir = tempfile.TemporaryDirectory()
+    os.environ["DB_URL"] = f"sqlite:///{os.path.join(temp_dir.name, 'load.db')}"
+    return temp_dir
+
+def prepare_database(args):
+    """Create the schema and, unless the existing data is kept, seed a catalog with order history"""
+    from benchmarks.data import build_dataset
+    from database.session import init_db, engine
+    from repository.stock_repository import StockRepository
+
+    init_db()
+    if not args.keep_data:
+        seed_session = build_dataset(engine, args.products, args.orders, stock=args.stock)
+        StockRepository(seed_session).record_baseline()
+        seed_session.close()
+
+def add_database_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--db-url", default=None, help="scratch database, a temporary SQLite file by default")
+    parser.add_argument("--keep-data", action="store_true", help="use the data already in --db-url instead of seeding")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000, help="seeded order history")
+    parser.add_argument("--stock", type=int, default=100000, help="seeded quantity of every product")
+    parser.add_argument("--api-latency", type=float, default=0, help="simulated Telegram API latency, ms")
+    parser.add_argument("--sync-interval", type=float, default=15, help="seconds between background sheet syncs")
+    parser.add_argument("--sheets-latency", type=float, default=0, help="simulated Google Sheets latency per call, ms")
+    parser.add_argument("--sheets-error-rate", type=float, default=0, help="share of sheet calls failing with 429")
+
+def print_latencies(latencies: List[float], elapsed: float):
+    print(f"Updates: {len(latencies)} in {elapsed:.2f} s, {len(latencies) / max(elapsed, 1e-9):.1f} updates/s")
+    print(f"Latency ms: p50 {percentile(latencies, 0.5) * 1000:.1f}, p95 {percentile(latencies, 0.95) * 1000:.1f}, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f}, max {max(latencies, default=0) * 1000:.1f}")
+
+def print_handler_report(local_bot: LocalBot):
+    """SQL statements per update, sheet and API calls, and a per-handler table from the metrics registry"""
+    from utils.metrics import DB_QUERIES_PER_UPDATE, HANDLER_SECONDS
+
+    handled = {key: (sum(counts), totals[0]) for key, (counts, totals) in DB_QUERIES_PER_UPDATE.values.items()}
+    queries = sum(total for _, total in handled.values())
+    handled_updates = sum(count for count, _ in handled.values())
+    print(f"DB queries per handled update: {queries / max(handled_updates, 1):.1f}")
+    print(f"Sheet calls: {', '.join(f'{method} {status} {count}' for (method, status), count in local_bot.sheets.calls.items())}")
+    print(local_bot.sheet_manager.tracer.get_summary())
+    print(f"Telegram API calls: {dict(local_bot.bot.session.calls)}")
+
+    print(f"\n{'handler':<36} {'calls':>7} {'mean ms':>9} {'queries':>8}")
+    for (router, handler), (counts, totals) in sorted(HANDLER_SECONDS.values.items(), key=lambda item: -item[1][1][0]):
+        calls, db_total = handled.get((handler,), (sum(counts), 0))
+        print(f"{handler:<36} {sum(counts):>7} {totals[0] / sum(counts) * 1000:>9.2f} {db_total / max(calls, 1):>8.1f}")
+
+class ScenarioAborted(Exception):
+    pass
+
+class Operator:
+    """One simulated operator chat driving updates through the Dispatcher"""
+    update_ids = itertools.count(1)
+
+    def __init__(self, chat_id: int, dp, bot, rng: random.Random, latencies: List[float]):
+        self.chat_id = chat_id
+        self.dp = dp
+        self.bot = bot
+        self.rng = rng
+        self.latencies = latencies
+        self.names = itertools.count(1)
+
+    async def _feed(self, payload: Dict[str, Any]):
+        from aiogram.types import Update
+        update = Update.model_validate({"update_id": next(self.update_ids), **payload}, context={"bot": self.bot})
+        start = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies.append(time.perf_counter() - start)
+
+    def _user(self) -> Dict[str, Any]:
+        return {"id": self.chat_id, "is_bot": False, "first_name": "Оператор"}
+
+    async def send(self, text: str):
+        await self._feed({"message": {
+            "message_id": next(self.bot.session.message_ids), "date": datetime.now(),
+            "chat": {"id": self.chat_id, "type": "private"}, "from": self._user(), "text": text
+        }})
+
+    def find_buttons(self, prefix: str) -> List[str]:
+        _, markup = self.bot.session.keyboards.get(self.chat_id, (None, None))
+        if not markup:
+            return []
+        return [button.callback_data for row in markup.inline_keyboard for button in row
+                if button.callback_data and button.callback_data.startswith(prefix)]
+
+    async def tap(self, prefix: str, optional: bool = False):
+        """Tap a random button of the latest inline keyboard whose callback data starts with prefix"""
+        buttons = self.find_buttons(prefix)
+        if not buttons:
+            if optional:
+                return
+            raise ScenarioAborted(prefix)
+
+        message_id, markup = self.bot.session.keyboards[self.chat_id]
+        await self._feed({"callback_query": {
+            "id": str(next(self.update_ids)), "from": self._user(), "chat_instance": str(self.chat_id),
+            "data": self.rng.choice(buttons),
+            "message": {"message_id": message_id, "date": datetime.now(), "chat": {"id": self.chat_id, "type": "private"}, "text": "",
+                        "reply_markup": markup.model_dump(exclude_none=True)}
+        }})
+
+    async def pick_product(self):
+        await self.tap("category_")
+        await self.tap("product_")
+        await self.tap("attribute_")
+        await self.tap("quantity_attribute:")
+
+async def new_order(operator: Operator):
+    await operator.send("➕ Новый заказ")
+    await operator.pick_product()
+    await operator.tap("order_continue:add_more")
+    await operator.pick_product()
+    await operator.tap("order_continue:finish")
+    await operator.send(f"Нагрузка {operator.chat_id}-{next(operator.names)}")
+
+async def add_items(operator: Operator):
+    await operator.send("📝 Активные заказы")
+    await operator.tap("view_edit_order:")
+    await operator.tap("order_action:add_item")
+    await operator.pick_product()
+    await operator.tap("order_action:back_to_list")
+
+async def adjust(operator: Operator):
+    await operator.send("📝 Активные заказы")
+    await operator.tap("view_edit_order:")
+    await operator.tap("order_action:edit_profit")
+    await operator.tap("add_adj", optional=True)
+    await operator.tap("profit_adj:discount")
+    await operator.send(str(operator.rng.choice([20, 50, 100])))
+
+async def complete(operator: Operator):
+    await operator.send("✅ Завершить заказ")
+    await operator.tap("complete_order:")
+    await operator.tap("completion_date:")
+
+async def statistics(operator: Operator):
+    await operator.send("📊 Статистика")
+    await operator.send(operator.rng.choice(["📅 Сегодня", "📅 Эта неделя"]))
+    await operator.send("🔙 Назад")
+
+SCENARIOS: Dict[str, Callable[[Operator], Any]] = {
+    "new_order": new_order, "add_items": add_items, "adjust": adjust, "complete": complete, "statistics": statistics
+}
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in filter(None, text.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+async def run(args) -> int:
+    from middleware import IDEMPOTENCY_TTL
+
+    prepare_database(args)
+    idempotency_ttl = IDEMPOTENCY_TTL if args.idempotency_ttl is None else args.idempotency_ttl
+    local_bot = LocalBot(args.api_latency / 1000, idempotency_ttl, args.sheets_latency / 1000, args.sheets_error_rate)
+    await local_bot.start(args.sync_interval)
+
+    mix = args.mix or SCENARIO_WEIGHTS
+    rng = random.Random(args.seed)
+    pending = iter(rng.choices(list(mix), weights=list(mix.values()), k=args.scenarios))
+    latencies: List[float] = []
+    outcomes = Counter()
+
+    async def operator_loop(index: int):
+        operator = Operator(FIRST_CHAT_ID + index, local_bot.dp, local_bot.bot, random.Random(args.seed + index), latencies)
+        for name in pending:
+            try:
+                await SCENARIOS[name](operator)
+                outcomes[name, "ok"] += 1
+            except ScenarioAborted:
+                outcomes[name, "aborted"] += 1
+                await operator.send("🔙 Назад")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(operator_loop(index) for index in range(args.operators)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await local_bot.stop()
+
+    summary = ", ".join(f"{name} {outcomes[name, 'ok']} ok/{outcomes[name, 'aborted']} aborted" for name in mix)
+    print(f"Scenarios with {args.operators} operators: {summary}")
+    print_latencies(latencies, elapsed)
+    print_handler_report(local_bot)
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Feed synthetic operator scenarios through the bot Dispatcher")
+    parser.add_argument("--operators", type=int, default=10, help="concurrent operator chats")
+    parser.add_argument("--scenarios", type=int, default=200, help="scenarios to run in total")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="scenario weights, e.g. new_order=3,complete=1")
+    add_database_arguments(parser)
+    parser.add_argument("--idempotency-ttl", type=float, default=None,
+                        help="seconds a repeated tap on an unchanged message is dropped, the bot default if omitted")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
+    temp_dir = use_scratch_database(args.db_url)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Micro-benchmarks of rendering and aggregation hot paths over synthetic data.
+
+    python -m benchmarks.micro                     # compare with baseline.json, exit 1 on regression
+    python -m benchmarks.micro --update-baseline   # store current timings as the new baseline
+
+Timings are kept in units of a calibration loop timed alongside each benchmark, so the baseline compares
+the code rather than the machine it was recorded on.
+"""
+import argparse, json, os, sys, timeit
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Tuple
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from benchmarks.data import create_scratch_engine, build_dataset, build_sheets
+from database.models import Order, OrderStatus, Product
+from repository.order_repository import OrderRepository, OrderPage
+from repository.sheets import SheetManager
+from repository.sheets_backend import MemoryBackend
+from service.order_service import OrderService
+from handlers.statistics import create_detailed_report, format_statistics_text
+from utils.shit_utils import format_order_msg, format_customer_message, format_price
+from utils.config import CONFIG
+from utils import keyboards
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.3
+REPEATS = 5
+CALIBRATION_SIZE = 2000
+
+def run_report(orders: Iterable[Order]) -> dict:
+    report_path, stats = create_detailed_report(orders, "бенчмарк")
+    os.remove(report_path)
+    return stats
+
+def build_benchmarks() -> Dict[str, Callable[[], object]]:
+    """Benchmark name -> zero-argument callable, all data prepared up front"""
+    engine = create_scratch_engine()
+    session = build_dataset(engine)
+    order_repo = OrderRepository(session)
+    order_service = OrderService(order_repo, None)
+
+    orders = session.query(Order).options(selectinload(Order.items), selectinload(Order.adjustments)).filter(
+        Order.status == OrderStatus.COMPLETED).order_by(Order.completed_at).all()
+    big_order = max(orders, key=lambda order: (len(order.adjustments), len(order.items)))
+    report_orders = orders[:500]
+
+    now = datetime.now()
+    stats = run_report(order_service.iter_completed_orders(now - timedelta(days=30), now))
+    prices = [i * 0.37 for i in range(1000)]
+
+    page = OrderPage(orders=[(order.id, order.display_name) for order in orders[:15]], first="a", last="b", has_prev=True, has_next=True)
+    product_names = sorted({product_name for order in orders for product_name in (item.product_name for item in order.items)})
+    months = [(2026, month, f"{CONFIG.STATS_MONTHS[month]} 2026") for month in range(1, 13)]
+    # Also fills CONFIG.PRODUCT_CATEGORIES from the sheet headers for the category keyboard
+    sheet_manager = SheetManager(sessionmaker(bind=engine), backend=MemoryBackend(build_sheets(session.query(Product).all())))
+
+    return {
+        "format_price": lambda: [format_price(price) for price in prices],
+        "format_order_msg": lambda: format_order_msg(big_order),
+        "format_customer_message": lambda: format_customer_message(big_order),
+        "format_statistics_text": lambda: format_statistics_text(stats, "месяц"),
+        "create_detailed_report_500": lambda: run_report(report_orders),
+        "report_stream_30d": lambda: run_report(order_service.iter_completed_orders(now - timedelta(days=30), now)),
+        "order_view_render": lambda: format_order_msg(order_repo.get_order_view(big_order.id)),
+        "sheet_sync_200": lambda: [sheet_manager._sync_sheet_products(sheet_name) for sheet_name in sheet_manager.product_sheets],
+        "kb_order_page": lambda: keyboards.get_order_page_keyboard(page, "view_edit_order"),
+        "kb_batch_complete": lambda: keyboards.get_batch_complete_keyboard(page, [order_id for order_id, _ in page.orders[::2]]),
+        "kb_products_page": lambda: keyboards.get_product_keyboard(product_names, "", 1),
+        "kb_attributes": lambda: keyboards.get_attribute_keyboard(product_names[:8]),
+        "kb_category": lambda: keyboards.get_category_keyboard(),
+        "kb_quantity": lambda: keyboards.get_quantity_keyboard(10, "attribute"),
+        "kb_order_items": lambda: keyboards.get_order_items_keyboard(big_order.items, "remove_item"),
+        "kb_months": lambda: keyboards.get_months_keyboard(months),
+    }
+
+def measure(func: Callable[[], object], calibration: Callable[[], object]) -> Tuple[float, float]:
+    """Best seconds per call of func and of the calibration loop, timed in alternating repeats so both
+    run under the same machine load"""
+    timers = [timeit.Timer(func), timeit.Timer(calibration)]
+    numbers = [timer.autorange()[0] for timer in timers]
+    best = [float("inf"), float("inf")]
+    for _ in range(REPEATS):
+        for i, timer in enumerate(timers):
+            best[i] = min(best[i], timer.timeit(numbers[i]) / numbers[i])
+    return best[0], best[1]
+
+def calibration_loop():
+    """Fixed pure-Python work, the unit every benchmark is expressed in"""
+    return sum(len(str(i)) for i in range(CALIBRATION_SIZE))
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[Tuple[str, float, float, float]]:
+    """(name, current, baseline, ratio) in calibration units for benchmarks slower than baseline by more than the tolerance"""
+    return [
+        (name, seconds, baseline[name], seconds / baseline[name])
+        for name, seconds in results.items()
+        if baseline.get(name) and seconds > baseline[name] * (1 + tolerance)
+    ]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of rendering and aggregation hot paths")
+    parser.add_argument("--update-baseline", action="store_true", help="store current timings as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--filter", default="", help="run only benchmarks containing this text")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    benchmarks = build_benchmarks()
+    for name, func in benchmarks.items():
+        if args.filter not in name:
+            continue
+        seconds, unit = measure(func, calibration_loop)
+        results[name] = seconds / unit
+        reference = baseline.get(name)
+        change = f"{(results[name] / reference - 1) * 100:+7.1f}%" if reference else "    new"
+        print(f"{name:<28} {seconds * 1e6:>12.1f} us {results[name]:>10.2f} units  {change}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    # A single slow run is usually the machine, only report benchmarks that stay slow when measured again
+    for name, *_ in compare(results, baseline, args.tolerance):
+        seconds, unit = measure(benchmarks[name], calibration_loop)
+        results[name] = min(results[name], seconds / unit)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, value, reference, ratio in regressions:
+        print(f"REGRESSION {name}: {value:.2f} vs {reference:.2f} calibration units in baseline ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
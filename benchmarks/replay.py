@@ -0,0 +1,139 @@
+"""Replay a recorded update log (RECORD_UPDATES) through the Dispatcher against a scratch database.
+
+    python -m benchmarks.replay updates.jsonl.gz                 # original pace
+    python -m benchmarks.replay updates.jsonl.gz --speed 10      # ten times faster
+    python -m benchmarks.replay updates.jsonl.gz --speed 0       # as fast as possible, users still in order
+"""
+import argparse, asyncio, logging, sys, time
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.load import LocalBot, use_scratch_database, prepare_database, add_database_arguments, print_latencies, \
+    print_handler_report, percentile
+from utils.update_log import read_update_log
+from utils.logging_setup import setup_logging
+
+class Replayer:
+    """Feeds recorded updates, remapping taps onto the keyboards the bot sent during this replay"""
+
+    def __init__(self, local_bot: LocalBot):
+        self.local_bot = local_bot
+        self.latencies: List[float] = []
+        self.outcomes = Counter()
+
+    def _remap_callback(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Order ids and message ids differ from the recording, so tap the button at the recorded position"""
+        callback = dict(record["callback_query"])
+        session = self.local_bot.bot.session
+        message_id, markup = session.keyboards.get(callback["from"]["id"], (None, None))
+        if not markup:
+            self.outcomes["callback without keyboard"] += 1
+            return callback
+
+        rows = markup.inline_keyboard
+        buttons = {button.callback_data for row in rows for button in row}
+        position = record.get("button")
+        if callback["data"] not in buttons and position and position[0] < len(rows) and position[1] < len(rows[position[0]]):
+            callback["data"] = rows[position[0]][position[1]].callback_data
+            self.outcomes["callback remapped"] += 1
+        elif callback["data"] not in buttons:
+            self.outcomes["callback unmatched"] += 1
+
+        callback["message"] = {**callback.get("message", {}), "message_id": message_id}
+        return callback
+
+    async def feed(self, record: Dict[str, Any]):
+        from aiogram.types import Update
+
+        payload = {"update_id": record["update_id"]}
+        if "callback_query" in record:
+            payload["callback_query"] = self._remap_callback(record)
+        elif "message" in record:
+            payload["message"] = {**record["message"], "message_id": next(self.local_bot.bot.session.message_ids)}
+        else:
+            payload["inline_query"] = record["inline_query"]
+
+        bot = self.local_bot.bot
+        update = Update.model_validate(payload, context={"bot": bot})
+        start = time.perf_counter()
+        try:
+            await self.local_bot.dp.feed_update(bot, update)
+            self.outcomes["handled"] += 1
+        except Exception as e:
+            self.outcomes["failed"] += 1
+            logging.warning(f"Replayed update {record['update_id']} failed: {e}")
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+def get_user_id(record: Dict[str, Any]) -> int:
+    payload = record.get("message") or record.get("callback_query") or record["inline_query"]
+    return payload["from"]["id"]
+
+async def run(args) -> int:
+    from middleware import IDEMPOTENCY_TTL
+
+    records = read_update_log(args.log)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print(f"No updates in {args.log}")
+        return 1
+
+    prepare_database(args)
+    # The recording includes taps the idempotency window dropped, scale the window with the pace to drop the same ones
+    idempotency_ttl = args.idempotency_ttl if args.idempotency_ttl is not None else IDEMPOTENCY_TTL / args.speed if args.speed else 0
+    local_bot = LocalBot(args.api_latency / 1000, idempotency_ttl, args.sheets_latency / 1000, args.sheets_error_rate)
+    await local_bot.start(args.sync_interval)
+    replayer = Replayer(local_bot)
+
+    # Updates of one user are fed in order like in production, users run concurrently
+    user_locks: Dict[int, asyncio.Lock] = {}
+    first_t, start = records[0]["t"], time.perf_counter()
+
+    async def replay_one(record: Dict[str, Any], lock: asyncio.Lock):
+        async with lock:
+            await replayer.feed(record)
+
+    tasks = []
+    try:
+        for record in records:
+            if args.speed:
+                delay = (record["t"] - first_t) / args.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            lock = user_locks.setdefault(get_user_id(record), asyncio.Lock())
+            tasks.append(asyncio.create_task(replay_one(record, lock)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    finally:
+        await local_bot.stop()
+
+    recorded = [record["ms"] / 1000 for record in records]
+    print(f"Replayed {len(records)} updates of {len(user_locks)} users at {f'{args.speed:g}x' if args.speed else 'max'} speed: "
+          f"{', '.join(f'{name} {count}' for name, count in replayer.outcomes.items())}")
+    print(f"Recorded latency ms: p50 {percentile(recorded, 0.5) * 1000:.1f}, p95 {percentile(recorded, 0.95) * 1000:.1f}, "
+          f"p99 {percentile(recorded, 0.99) * 1000:.1f}")
+    print_latencies(replayer.latencies, elapsed)
+    print_handler_report(local_bot)
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded updates through the bot Dispatcher")
+    parser.add_argument("log", help="gzip JSONL log written with RECORD_UPDATES")
+    parser.add_argument("--speed", type=float, default=1, help="1 keeps recorded pacing, N is N times faster, 0 is as fast as possible")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N updates")
+    add_database_arguments(parser)
+    parser.add_argument("--idempotency-ttl", type=float, default=None, help="seconds a repeated tap is dropped, scaled by --speed by default")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
+    temp_dir = use_scratch_database(args.db_url)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+if __name__ == "__main__":
+    sys.exit(main())
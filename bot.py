@@ -4,30 +4,49 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from database.session import init_db, Session
+from database.session import init_db, session_factory
 from repository.sheets import SheetManager
-from middleware import DependencyMiddleware
-from handlers import start, statistics, echo
+from middleware import DependencyMiddleware, IdempotencyMiddleware, MetricsMiddleware, SqlProfilerMiddleware, RecorderMiddleware, \
+    IDEMPOTENCY_TTL
+from send_scheduler import SendScheduler, GLOBAL_RATE
+from handlers import start, statistics, echo, search, admin
 from handlers.menu import actions, edit_order_callbacks, order_action_callbacks, select_product_callbacks, adj_order_callbacks
 from handlers.navigation import navigation
+from utils.config import CONFIG
+from utils.metrics import start_metrics_server
+from utils.loop_monitor import LoopMonitor
+from utils.update_log import UpdateLogWriter
+from utils.logging_setup import setup_logging
 
-async def main():
-    init_db()
-
+def build_bot(send_rate: float = GLOBAL_RATE) -> Bot:
     bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
-    await bot.delete_webhook(drop_pending_updates=True)
+    bot.session.middleware(SendScheduler(global_rate=send_rate))
+    return bot
 
+def build_dispatcher(sheet_manager: SheetManager, idempotency_ttl: float = IDEMPOTENCY_TTL,
+                     record_path: str = CONFIG.RECORD_UPDATES) -> Dispatcher:
     dp = Dispatcher(storage=MemoryStorage())
 
-    session = Session()
-    sheet_manager = SheetManager(session)
+    if record_path:
+        writer = UpdateLogWriter(record_path)
+        dp.update.outer_middleware(RecorderMiddleware(writer))
+        dp.shutdown.register(writer.close)
 
-    dp.update.middleware(DependencyMiddleware(sheet_manager))
+    dp.callback_query.outer_middleware(IdempotencyMiddleware(idempotency_ttl))
 
-    await sheet_manager.start_background_tasks()
+    # Registered first so handler timings include building the dependencies
+    metrics_middleware = MetricsMiddleware()
+    profiler_middleware = SqlProfilerMiddleware() if CONFIG.SQL_PROFILE else None
+    dependency_middleware = DependencyMiddleware(sheet_manager)
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(metrics_middleware)
+        if profiler_middleware:
+            observer.middleware(profiler_middleware)
+        observer.middleware(dependency_middleware)
 
     dp.include_routers(
         start.router,
+        search.router,
         actions.router,
         select_product_callbacks.router,
         order_action_callbacks.router,
@@ -35,20 +54,42 @@ async def main():
         adj_order_callbacks.router,
         navigation.router,
         statistics.router,
+        admin.router,
         echo.router
     )
+    return dp
+
+async def main():
+    init_db()
+
+    bot = build_bot()
+    await bot.delete_webhook(drop_pending_updates=True)
+
+    sheet_manager = SheetManager(session_factory)
+    dp = build_dispatcher(sheet_manager)
+
+    await sheet_manager.start_background_tasks()
+    metrics_runner = await start_metrics_server(CONFIG.METRICS_PORT) if CONFIG.METRICS_PORT else None
+    loop_monitor = LoopMonitor(threshold=CONFIG.LOOP_STALL_MS / 1000)
+    loop_monitor.start()
 
     try:
         logging.info("Bot starting...")
         await dp.start_polling(bot)
     finally:
+        await loop_monitor.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await sheet_manager.stop_background_tasks()
-        session.close()
         await bot.session.close()
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    setup_logging()
     try:
-        asyncio.run(main())
+        if CONFIG.WORKERS > 1:
+            from supervisor import run_supervisor
+            run_supervisor(CONFIG.WORKERS)
+        else:
+            asyncio.run(main())
     except Exception as e:
         logging.error(f"Critical error: {e}", exc_info=True)
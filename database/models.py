@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -10,6 +10,13 @@ class OrderStatus(enum.Enum):
     PENDING = "pending"
     COMPLETED = "completed"
 
+class MovementReason(enum.Enum):
+    INITIAL = "initial"
+    SALE = "sale"
+    RETURN = "return"
+    MANUAL = "manual"
+    SYNC = "sync"
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -58,6 +65,19 @@ class Order(Base):
     completed_at = Column(DateTime, nullable=True)
     status = Column(Enum(OrderStatus), default=OrderStatus.PENDING)
 
+    # Kept in sync by OrderRepository on every item/adjustment change
+    total_items = Column(Float, nullable=False, default=0, server_default="0")
+    total_cost = Column(Float, nullable=False, default=0, server_default="0")
+    total_adjustments = Column(Float, nullable=False, default=0, server_default="0")
+    profit = Column(Float, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_orders_status_completed_at", "status", "completed_at"),
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_id_trgm", "id", postgresql_using="gin", postgresql_ops={"id": "gin_trgm_ops"}),
+        Index("ix_orders_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     adjustments = relationship("ProfitAdjustment", back_populates="order", cascade="all, delete-orphan")
 
@@ -65,30 +85,10 @@ class Order(Base):
     def display_name(self):
         return self.name or self.id
 
-    @property
-    def total_items(self):
-        return sum(item.price * item.quantity for item in self.items)
-
-    @property
-    def total_adjustments(self):
-        return sum(adj.amount for adj in self.adjustments if adj.affects_total)
-
-    @property
-    def total_profit_adjustments(self):
-        return sum(adj.profit_amount if adj.profit_amount is not None else adj.amount for adj in self.adjustments)
-
     @property
     def total(self):
         return max(0, self.total_items + self.total_adjustments)
 
-    @property
-    def total_cost(self):
-        return sum(item.cost * item.quantity for item in self.items)
-
-    @property
-    def profit(self):
-        return self.total_items - self.total_cost + self.total_profit_adjustments
-
     @property
     def discount(self):
         return sum(adj.amount for adj in self.adjustments if adj.affects_total and adj.amount < 0)
@@ -100,13 +100,18 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(String, ForeignKey("orders.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    order_id = Column(String, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
     product_name = Column(String, nullable=True)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
     cost = Column(Float, nullable=False)
 
+    __table_args__ = (
+        Index("ix_order_items_product_name_trgm", "product_name", postgresql_using="gin",
+              postgresql_ops={"product_name": "gin_trgm_ops"}),
+    )
+
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
 
@@ -122,3 +127,64 @@ class OrderItem(Base):
 
     def __repr__(self):
         return f"<OrderItem {self.display_name} x{self.quantity}>"
+
+class StockMovement(Base):
+    """Append-only record of every on-hand quantity change"""
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    delta = Column(Integer, nullable=False)
+    reason = Column(Enum(MovementReason), nullable=False)
+    order_id = Column(String, nullable=True)
+    source = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_id", "product_id", "id"),
+        Index("ix_stock_movements_created_at", "created_at"),
+    )
+
+    product = relationship("Product")
+
+    def __repr__(self):
+        prefix = "+" if self.delta > 0 else ""
+        return f"<StockMovement {self.product_id} {prefix}{self.delta} ({self.reason.value})>"
+
+class StockSnapshot(Base):
+    """Product quantity as of the last movement it includes"""
+    __tablename__ = "stock_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    movement_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_stock_snapshots_product_id_created_at", "product_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<StockSnapshot {self.product_id} = {self.quantity} @ {self.movement_id}>"
+
+class SheetCategory(Base):
+    """Worksheet read from the spreadsheet with its attribute header, shared with workers that do not open the sheets"""
+    __tablename__ = "sheet_categories"
+
+    sheet_name = Column(String, primary_key=True)
+    attribute = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<SheetCategory {self.sheet_name} ({self.attribute})>"
+
+class AppliedMigration(Base):
+    """One-off data migration already run by init_db"""
+    __tablename__ = "applied_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<AppliedMigration {self.name}>"
@@ -0,0 +1,44 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from database.models import OrderStatus
+
+@dataclass(slots=True)
+class OrderItemView:
+    display_name: str
+    quantity: int
+    price: float
+
+@dataclass(slots=True)
+class AdjustmentView:
+    amount: float
+    reason: str
+    affects_total: bool
+
+@dataclass(slots=True)
+class OrderView:
+    """Read-only order built from projected columns, renders like Order without identity map or change tracking"""
+    id: str
+    name: Optional[str]
+    status: OrderStatus
+    created_at: datetime
+    completed_at: Optional[datetime]
+    total_items: float
+    total_cost: float
+    total_adjustments: float
+    profit: float
+    items: List[OrderItemView] = field(default_factory=list)
+    adjustments: List[AdjustmentView] = field(default_factory=list)
+
+    @property
+    def display_name(self):
+        return self.name or self.id
+
+    @property
+    def total(self):
+        return max(0, self.total_items + self.total_adjustments)
+
+    @property
+    def discount(self):
+        return sum(adj.amount for adj in self.adjustments if adj.affects_total and adj.amount < 0)
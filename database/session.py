@@ -1,15 +1,112 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, text, inspect
+from typing import Dict, List
 from sqlalchemy.orm import sessionmaker, scoped_session
 
-from database.models import Base
+from database.models import Base, AppliedMigration, MovementReason
 from utils.config import get_db_url
+from utils.metrics import instrument_engine
 
 engine = create_engine(get_db_url())
+instrument_engine(engine)
 session_factory = sessionmaker(bind=engine)
 Session = scoped_session(session_factory)
 
 def init_db():
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+    has_ledger = inspect(engine).has_table("stock_movements")
     Base.metadata.create_all(engine)
+    added_columns = add_missing_columns()
+
+    # create_all skips tables that already exist, so add indexes introduced later separately
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+    backfill(recalculate_totals="total_items" in added_columns.get("orders", []), record_baseline=not has_ledger)
+    run_migrations()
+
+def backfill(recalculate_totals: bool, record_baseline: bool):
+    """Fill data for columns and tables introduced by a schema upgrade"""
+    if not recalculate_totals and not record_baseline:
+        return
+
+    from repository.order_repository import OrderRepository
+    from repository.stock_repository import StockRepository
+    session = Session()
+    try:
+        if recalculate_totals:
+            OrderRepository(session).recalculate_totals()
+        if record_baseline:
+            stock_repo = StockRepository(session)
+            stock_repo.record_baseline()
+            stock_repo.take_snapshots()
+    finally:
+        session.close()
+
+def release_reservations(session):
+    """Pending order items were subtracted from stock when added before reservations existed,
+    put them back on hand so completing those orders does not subtract them again"""
+    from repository.product_repository import ProductRepository
+    from repository.stock_repository import SOURCE_MAINTENANCE
+    from repository.sheets import SheetManager, QuantityUpdate
+
+    product_repo = ProductRepository(session)
+    reserved = product_repo.get_reserved_quantities()
+    if reserved:
+        # The owner's sync copies the sheet into the database, so the sheet is written first and a failed write raises
+        # before anything is committed, leaving the migration to the next start
+        sheet_manager = SheetManager(session_factory)
+        try:
+            sheet_manager.backend.values_batch_update(sheet_manager.get_quantity_data([
+                QuantityUpdate(product.id, product.quantity + reserved[product.id], product.sheet_name, product.sheet_row)
+                for product in product_repo.get_by_ids(reserved)
+            ]))
+        finally:
+            sheet_manager.executor.shutdown(wait=True)
+
+    # Committed together with the quantities by the ledger
+    session.add(AppliedMigration(name="release_reservations"))
+    product_repo.adjust_quantities(reserved, MovementReason.RETURN, SOURCE_MAINTENANCE)
+    logging.info(f"Released reserved stock of {len(reserved)} products")
+
+MIGRATIONS = {"release_reservations": release_reservations}
+
+def run_migrations():
+    """Run data migrations that are not recorded in applied_migrations yet, each exactly once"""
+    session = Session()
+    try:
+        applied = {name for name, in session.query(AppliedMigration.name)}
+        for name, migration in MIGRATIONS.items():
+            if name not in applied:
+                migration(session)
+    finally:
+        session.close()
+
+def add_missing_columns() -> Dict[str, List[str]]:
+    """Add model columns that are missing in existing tables, returns added column names per table"""
+    inspector = inspect(engine)
+    added = {}
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable and column.server_default is not None:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.setdefault(table.name, []).append(column.name)
+
+    return added
 
 def get_session():
     session = Session()
@@ -0,0 +1,31 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from repository.sheets import SheetManager
+from auth_manager import auth_manager
+
+router = Router()
+
+KINDS = {"read": "Чтение", "write": "Запись"}
+
+@router.message(Command("quota"))
+async def quota_handler(message: Message, sheet_manager: SheetManager):
+    if not auth_manager.is_user_authorized(message.from_user.id):
+        await message.answer("Я не понимаю эту команду")
+        return
+
+    usage = sheet_manager.tracer.get_usage()
+    lines = ["📈 *Квота Google Sheets за последнюю минуту*\n"]
+    for kind, (used, quota) in usage["units"].items():
+        lines.append(f"{KINDS[kind]}: {used}/{quota} ({used * 100 // max(quota, 1)}%)")
+
+    if usage["operations"]:
+        lines.append("")
+    for name, stats in usage["operations"].items():
+        lines.append(f"`{name}`: {int(stats['calls'])} вызовов, ошибок {int(stats['errors'])}, повторов {int(stats['retries'])}, "
+                     f"среднее {stats['seconds'] / stats['calls'] * 1000:.0f} мс, макс {stats['max_seconds'] * 1000:.0f} мс")
+
+    if not sheet_manager.is_owner:
+        lines.append("\nСинхронизацию ведет другой процесс, здесь видны только вызовы этого процесса")
+    await message.answer("\n".join(lines))
@@ -1,14 +1,20 @@
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import Message, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 
-from utils.keyboards import get_orders_menu, get_category_keyboard, get_order_names_keyboard, get_date_keyboard
+from utils.keyboards import (get_orders_menu, get_products_menu, get_category_keyboard, get_order_page_keyboard, get_date_keyboard,
+                             get_found_orders_keyboard, get_cancel_keyboard, get_batch_complete_keyboard)
 from utils.config import CONFIG
+from utils.shit_utils import escape_markdown
+from utils.states import OrderStates, ProductStates
 from service.order_service import OrderService
 from service.product_service import ProductService
 
 router = Router()
 
+STOCK_FILE_MAX_SIZE = 1024 * 1024
+REPORT_MAX_LENGTH = 4000
+
 @router.message(F.text == "➕ Новый заказ")
 async def new_order(message: Message, state: FSMContext, order_service: OrderService, product_service: ProductService):
     """Start new order creation"""
@@ -29,18 +35,30 @@ async def new_order(message: Message, state: FSMContext, order_service: OrderSer
 @router.message(F.text.in_({"✅ Завершить заказ", "🗑️ Удалить заказ", "💬 Сообщение клиенту", "📝 Активные заказы"}))
 async def handle_order_commands(message: Message, state: FSMContext, order_service: OrderService):
     """Handle order-related commands"""
-    order_data = order_service.get_active_order_names()
+    page = order_service.get_active_orders_page()
 
-    if not order_data:
+    if not page.orders:
         await message.answer("Нет активных заказов", reply_markup=get_orders_menu())
         return
 
     action, message_text, callback_prefix = CONFIG.ACTIONS_MAP[message.text]
     response = await message.answer(message_text,
-        reply_markup=get_order_names_keyboard(order_data, callback_prefix)
+        reply_markup=get_order_page_keyboard(page, callback_prefix)
     )
 
-    await state.update_data(action=action, inline_message_id=response.message_id)
+    await state.update_data(action=action, list_prefix=callback_prefix, restore_date=None, inline_message_id=response.message_id)
+
+@router.message(F.text == "☑️ Завершить несколько")
+async def start_batch_completion(message: Message, state: FSMContext, order_service: OrderService):
+    """Show active orders to pick several for completion"""
+    page = order_service.get_active_orders_page()
+
+    if not page.orders:
+        await message.answer("Нет активных заказов", reply_markup=get_orders_menu())
+        return
+
+    response = await message.answer("Отметь заказы для завершения", reply_markup=get_batch_complete_keyboard(page, []))
+    await state.update_data(batch_selected=[], batch_cursor=None, batch_backward=False, inline_message_id=response.message_id)
 
 @router.message(F.text == "🔄 Восстановить заказ")
 async def handle_restore_order(message: Message, state: FSMContext, order_service: OrderService):
@@ -57,6 +75,29 @@ async def handle_restore_order(message: Message, state: FSMContext, order_servic
 
     await state.update_data(inline_message_id=response.message_id)
 
+@router.message(F.text == "🔍 Найти заказ")
+async def start_order_search(message: Message, state: FSMContext):
+    """Ask for order search query"""
+    await state.set_state(OrderStates.ENTER_SEARCH_QUERY)
+    await message.answer("Введи имя заказа, его номер или название товара из заказа")
+
+@router.message(OrderStates.ENTER_SEARCH_QUERY)
+async def search_orders(message: Message, state: FSMContext, order_service: OrderService):
+    """Show first page of orders matching the query"""
+    query = message.text.strip() if message.text else ""
+    if len(query) < 2:
+        await message.answer("Запрос слишком короткий\n\nВведи хотя бы 2 символа")
+        return
+
+    page = order_service.search_orders(query)
+    if not page.orders:
+        await message.answer(f"По запросу \"{escape_markdown(query)}\" ничего не найдено\n\nВведи другой запрос")
+        return
+
+    response = await message.answer(f"Заказы по запросу \"{escape_markdown(query)}\"", reply_markup=get_found_orders_keyboard(page))
+    await state.set_state(None)
+    await state.update_data(search_query=query, search_cursor=None, search_backward=False, inline_message_id=response.message_id)
+
 @router.message(F.text.in_({"➕ Добавить количество", "➖ Убрать количество"}))
 async def start_product_operation(message: Message, state: FSMContext, product_service: ProductService):
     """Start product operation (add or remove quantity)"""
@@ -71,3 +112,46 @@ async def start_product_operation(message: Message, state: FSMContext, product_s
     )
 
     await state.update_data(action=action, inline_message_id=response.message_id)
+
+@router.message(F.text == "📥 Загрузить остатки")
+async def start_stock_upload(message: Message, state: FSMContext):
+    """Ask for a stock intake file"""
+    response = await message.answer("Отправь CSV или текстовый файл, каждая строка в формате\n\n"
+        "`категория;товар;атрибут;количество`\n\nОтрицательное количество списывает товар",
+        reply_markup=get_cancel_keyboard()
+    )
+
+    await state.set_state(ProductStates.UPLOAD_STOCK_FILE)
+    await state.update_data(context="products", inline_message_id=response.message_id)
+
+@router.message(ProductStates.UPLOAD_STOCK_FILE, F.document)
+async def upload_stock_file(message: Message, state: FSMContext, product_service: ProductService):
+    """Apply all lines of the uploaded file and report the result of each one"""
+    if message.document.file_size and message.document.file_size > STOCK_FILE_MAX_SIZE:
+        await message.answer("Файл слишком большой (более 1 МБ)\n\nОтправь файл поменьше")
+        return
+
+    raw = (await message.bot.download(message.document)).read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1251", errors="replace")
+
+    results = product_service.apply_stock_intake(text)
+    await state.clear()
+    await state.update_data(context="products")
+
+    if not results:
+        await message.answer("В файле нет строк для загрузки", reply_markup=get_products_menu())
+        return
+
+    applied = sum(1 for _, ok, _ in results if ok)
+    summary = f"📥 Загрузка остатков завершена\n\nПрименено строк: {applied}, с ошибками: {len(results) - applied}"
+    report = "\n".join(f"{'✅' if ok else '❌'} {line_no}: {line_message}" for line_no, ok, line_message in results)
+
+    if len(summary) + len(report) + 2 > REPORT_MAX_LENGTH:
+        await message.answer_document(BufferedInputFile(report.encode("utf-8"), filename="stock_intake_report.txt"),
+            caption=summary, parse_mode=None, reply_markup=get_products_menu())
+        return
+
+    await message.answer(f"{summary}\n\n{report}", parse_mode=None, reply_markup=get_products_menu())
@@ -6,6 +6,7 @@ from repository.order_repository import OrderRepository
 from utils.keyboards import get_quantity_keyboard, get_order_items_keyboard, get_order_continue_keyboard, get_order_actions_keyboard
 from utils.shit_utils import format_order_msg
 from service.order_service import OrderService
+from service.product_service import ProductService
 
 router = Router()
 
@@ -31,12 +32,14 @@ async def remove_item(callback: CallbackQuery, state: FSMContext, order_service:
     await callback.answer()
 
 @router.callback_query(F.data.startswith("edit_item:"))
-async def edit_item_quantity(callback: CallbackQuery, state: FSMContext, order_repo: OrderRepository):
+async def edit_item_quantity(callback: CallbackQuery, state: FSMContext, order_repo: OrderRepository, product_service: ProductService):
     item_id = int(callback.data.split(":")[1])
     item = order_repo.get_order_item(item_id)
 
+    # Available stock already excludes this item's own reservation
+    available = product_service.get_available_quantity(item.product)
     await callback.message.edit_text(f"Товар: {item.product.full_name}\n\nТекущее количество: {item.quantity}\n",
-        reply_markup=get_quantity_keyboard(min(item.quantity + item.product.quantity, 10),
+        reply_markup=get_quantity_keyboard(min(item.quantity + available, 10),
         callback_str="order_items", exclude_qty=item.quantity, cancel_to="order-actions")
     )
 
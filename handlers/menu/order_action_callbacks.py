@@ -11,11 +11,15 @@ from utils.keyboards import (
     get_date_keyboard,
     get_adjustment_keyboard,
     get_all_adjustments_keyboard,
-    get_order_names_keyboard
+    get_order_page_keyboard,
+    get_found_orders_keyboard,
+    get_found_order_keyboard,
+    get_batch_complete_keyboard
 )
-from utils.shit_utils import format_order_msg
+from utils.shit_utils import format_order_msg, format_price, escape_markdown
 from utils.config import CONFIG
 from utils.states import OrderStates
+from database.models import OrderStatus
 from service.order_service import OrderService
 
 router = Router()
@@ -24,13 +28,55 @@ router = Router()
 async def view_edit_order(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
     """Show order details with edit options"""
     order_id = callback.data.split(":")[1]
-    order = order_service.get_order(order_id)
+    order = order_service.get_order_view(order_id)
 
     order_text = f"Заказ {order.display_name}\n" + format_order_msg(order) + "\nВыбери действие"
     await callback.message.edit_text(order_text, reply_markup=get_order_actions_keyboard())
     await state.update_data(order_id=order.id, action="view_edit")
     await callback.answer()
 
+@router.callback_query(F.data.startswith("find_page:"))
+async def show_search_page(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Show another page of order search results"""
+    parts = callback.data.split(":")
+    data = await state.get_data()
+    query = data.get("search_query")
+
+    if not query:
+        await callback.message.edit_text("Результаты поиска устарели, начни поиск заново")
+        await callback.answer()
+        return
+
+    if parts[1] == "c":
+        cursor, backward = data.get("search_cursor"), data.get("search_backward", False)
+    else:
+        cursor, backward = parts[2], parts[1] == "p"
+
+    page = order_service.search_orders(query, cursor, backward)
+    await callback.message.edit_text(f"Заказы по запросу \"{escape_markdown(query)}\"", reply_markup=get_found_orders_keyboard(page))
+    await state.update_data(search_cursor=cursor, search_backward=backward)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("found_order:"))
+async def show_found_order(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Show order picked from search results"""
+    order_id = callback.data.split(":")[1]
+    order = order_service.get_order_view(order_id)
+
+    if not order:
+        await callback.answer("Заказ не найден, возможно он был удален", show_alert=True)
+        return
+
+    if order.status == OrderStatus.PENDING:
+        order_text = f"Заказ {order.display_name}\n" + format_order_msg(order) + "\nВыбери действие"
+        await callback.message.edit_text(order_text, reply_markup=get_order_actions_keyboard())
+        await state.update_data(order_id=order.id, action="view_edit")
+    else:
+        order_text = f"Заказ {order.display_name}, завершен {order.completed_at.strftime('%d.%m.%Y')}\n" + format_order_msg(order)
+        await callback.message.edit_text(order_text, reply_markup=get_found_order_keyboard(order.id))
+
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("complete_order:"))
 async def select_completion_date(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
     """Select completion date for an order"""
@@ -66,16 +112,93 @@ async def complete_order(callback: CallbackQuery, state: FSMContext, order_servi
     await state.update_data(context="orders")
     await callback.answer()
 
+@router.callback_query(F.data.startswith("batch_toggle:"))
+async def toggle_batch_order(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Select or unselect an order for batch completion"""
+    order_id = callback.data.split(":")[1]
+    data = await state.get_data()
+    selected = data.get("batch_selected", [])
+
+    selected = [selected_id for selected_id in selected if selected_id != order_id] if order_id in selected else selected + [order_id]
+    page = order_service.get_active_orders_page(data.get("batch_cursor"), data.get("batch_backward", False))
+
+    await callback.message.edit_reply_markup(reply_markup=get_batch_complete_keyboard(page, selected))
+    await state.update_data(batch_selected=selected)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("batch_page:"))
+async def show_batch_page(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Show another page of orders for batch completion"""
+    _, direction, cursor = callback.data.split(":")
+    data = await state.get_data()
+
+    page = order_service.get_active_orders_page(cursor, direction == "p")
+    await callback.message.edit_reply_markup(reply_markup=get_batch_complete_keyboard(page, data.get("batch_selected", [])))
+    await state.update_data(batch_cursor=cursor, batch_backward=direction == "p")
+    await callback.answer()
+
+@router.callback_query(F.data == "batch_complete")
+async def select_batch_completion_date(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Select one completion date for all selected orders"""
+    data = await state.get_data()
+    selected = data.get("batch_selected", [])
+
+    date_options = order_service.get_batch_completion_date_options(selected)
+    if not date_options:
+        await callback.answer("Выбери хотя бы один заказ", show_alert=True)
+        return
+
+    await callback.message.edit_text(f"Выбери дату завершения для {len(selected)} заказов",
+        reply_markup=get_date_keyboard(date_options, "batch_date")
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("batch_date:"))
+async def complete_selected_orders(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Complete all selected orders with one date and show a summary"""
+    completion_date = datetime.fromisoformat(callback.data.split(":")[1])
+    data = await state.get_data()
+
+    completed, skipped = order_service.complete_orders(data.get("batch_selected", []), completion_date)
+
+    summary = f"✅ Завершено заказов: {len(completed)} на сумму {format_price(sum(order.total for order in completed))} грн\n"
+    summary += "".join(f"- {order.display_name}\n" for order in completed)
+    if skipped:
+        summary += f"\n⚠️ Пропущено: {len(skipped)}\n"
+        summary += "".join(f"- {order.display_name}: {reason}\n" for order, reason in skipped)
+
+    await callback.message.edit_text(summary)
+    await callback.message.answer("Выбери действие", reply_markup=get_orders_menu())
+    await state.clear()
+    await state.update_data(context="orders")
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("restore_date:"))
-async def select_restore_date(callback: CallbackQuery, order_service: OrderService):
+async def select_restore_date(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
     """Handle restore date selection - show orders completed on that date"""
     date_str = callback.data.split(":")[1]
     selected_date = date.fromisoformat(date_str)
 
-    order_data = order_service.get_completed_orders_display_names_by_date(selected_date)
+    page = order_service.get_completed_orders_page_by_date(selected_date)
     await callback.message.edit_text(f"Выбери заказ для активации",
-        reply_markup=get_order_names_keyboard(order_data, "restore_order")
+        reply_markup=get_order_page_keyboard(page, "restore_order")
     )
+    await state.update_data(list_prefix="restore_order", restore_date=date_str)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("orders_page:"))
+async def show_orders_page(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Show next or previous page of an order list"""
+    _, direction, cursor = callback.data.split(":")
+    data = await state.get_data()
+    prefix, restore_date = data.get("list_prefix"), data.get("restore_date")
+
+    if restore_date:
+        page = order_service.get_completed_orders_page_by_date(date.fromisoformat(restore_date), cursor, direction == "p")
+    else:
+        page = order_service.get_active_orders_page(cursor, direction == "p")
+
+    await callback.message.edit_reply_markup(reply_markup=get_order_page_keyboard(page, prefix))
     await callback.answer()
 
 @router.callback_query(F.data.startswith("restore_order:"))
@@ -112,19 +235,19 @@ async def delete_order(callback: CallbackQuery, state: FSMContext, order_service
     order = order_service.get_order(order_id)
 
     message = order_service.delete_order(order)
-    order_data = order_service.get_active_order_names()
+    page = order_service.get_active_orders_page()
     await state.clear()
 
-    if not order_data:
+    if not page.orders:
         await callback.message.edit_text(message)
         await callback.message.answer("Выбери действие", reply_markup=get_orders_menu())
         await state.update_data(context="orders")
     else:
         action, message_text, callback_prefix = CONFIG.ACTIONS_MAP["🗑️ Удалить заказ"]
         await callback.message.edit_text(message + "\n\n" + message_text,
-            reply_markup=get_order_names_keyboard(order_data, callback_prefix)
+            reply_markup=get_order_page_keyboard(page, callback_prefix)
         )
-        await state.update_data(context="orders", action=action)
+        await state.update_data(context="orders", action=action, list_prefix=callback_prefix)
     await callback.answer()
 
 @router.callback_query(F.data.startswith("customer_msg_order:"))
@@ -149,13 +272,13 @@ async def handle_order_action(callback: CallbackQuery, state: FSMContext, order_
     order = order_service.get_order(order_id)
 
     if action == "back_to_list":
-        order_data = order_service.get_active_order_names()
+        page = order_service.get_active_orders_page()
         action_data, message_text, callback_prefix = CONFIG.ACTIONS_MAP["📝 Активные заказы"]
         response = await callback.message.edit_text(message_text,
-            reply_markup=get_order_names_keyboard(order_data, callback_prefix)
+            reply_markup=get_order_page_keyboard(page, callback_prefix)
         )
         await state.clear()
-        await state.update_data(context="orders", action=action_data, inline_message_id=response.message_id)
+        await state.update_data(context="orders", action=action_data, list_prefix=callback_prefix, inline_message_id=response.message_id)
         await callback.answer()
         return
 
@@ -59,6 +59,21 @@ async def select_product(callback: CallbackQuery, state: FSMContext, product_ser
     await state.update_data(product_name=product_name, attributes=attributes)
     await callback.answer()
 
+@router.callback_query(F.data.startswith("page_"))
+async def change_catalog_page(callback: CallbackQuery, state: FSMContext):
+    call, page_str = callback.data.split(":")
+    _, kind, cancel_to = call.split("_", 2)
+    page = int(page_str)
+
+    data = await state.get_data()
+    if kind == "product":
+        keyboard = get_product_keyboard(data.get("product_names", []), cancel_to, page)
+    else:
+        keyboard = get_attribute_keyboard(data.get("attributes", []), cancel_to, page)
+
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("attribute_"))
 async def select_attribute(callback: CallbackQuery, state: FSMContext, product_service: ProductService):
     call, index_str = callback.data.split(":")
@@ -69,7 +84,7 @@ async def select_attribute(callback: CallbackQuery, state: FSMContext, product_s
 
     attribute = attributes[index]
     product = product_service.get_product(category, product_name, attribute)
-    max_qty = 10 if action == "add" else min(product.quantity, 10)
+    max_qty = 10 if action == "add" else min(product_service.get_available_quantity(product), 10)
 
     await callback.message.edit_text(f"Выбери количество товара *\"{product.full_name}*\"\n",
         reply_markup=get_quantity_keyboard(max_qty, "attribute", cancel_to=call.split("_")[1])
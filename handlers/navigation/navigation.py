@@ -34,7 +34,7 @@ async def handle_cancel(callback: CallbackQuery, state: FSMContext, order_servic
     await state.clear()
 
     if destination.startswith("order-act") and order_id:
-        order = order_service.get_order(order_id)
+        order = order_service.get_order_view(order_id)
         order_text = f"Заказ {order.display_name}\n" + format_order_msg(order)
         response = await callback.message.edit_text(order_text, reply_markup=get_order_actions_keyboard())
         await state.update_data(context="orders", order_id=order_id, action="view_edit", inline_message_id=response.message_id)
@@ -0,0 +1,65 @@
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.fsm.context import FSMContext
+
+from utils.keyboards import get_quantity_keyboard
+from utils.shit_utils import format_price
+from service.product_service import ProductService
+from auth_manager import auth_manager
+
+router = Router()
+
+SEARCH_ACTIONS = {"new_order", "view_edit", "add", "remove"}
+
+@router.inline_query()
+async def search_products(inline_query: InlineQuery, product_service: ProductService):
+    """Inline product search: @bot <query>"""
+    if not auth_manager.is_user_authorized(inline_query.from_user.id):
+        await inline_query.answer([], cache_time=60, is_personal=True)
+        return
+
+    results = [
+        InlineQueryResultArticle(
+            id=str(product.id),
+            title=product.full_name,
+            description=f"{product.sheet_name} · {format_price(product.price)} грн",
+            input_message_content=InputTextMessageContent(message_text=f"/product {product.id}", parse_mode=None)
+        )
+        for product in product_service.search_products(inline_query.query)
+    ]
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
+@router.message(Command("product"))
+async def select_found_product(message: Message, command: CommandObject, state: FSMContext, product_service: ProductService):
+    """Jump from inline search result straight to quantity selection"""
+    if not auth_manager.is_user_authorized(message.from_user.id):
+        await message.answer("Я не понимаю эту команду")
+        return
+
+    data = await state.get_data()
+    action = data.get("action")
+
+    if action not in SEARCH_ACTIONS:
+        await message.answer("Открой заказ или выбери операцию с товаром, чтобы использовать поиск")
+        return
+
+    product = product_service.get_product_by_id(int(command.args)) if command.args and command.args.isdigit() else None
+    if not product or product.is_archived:
+        await message.answer("Товар не найден")
+        return
+
+    max_qty = 10 if action == "add" else min(product_service.get_available_quantity(product), 10)
+    if max_qty <= 0:
+        await message.answer(f"Товара *\"{product.full_name}\"* нет в наличии")
+        return
+
+    cancel_to = "order-actions" if action == "view_edit" else ""
+    response = await message.answer(f"Выбери количество товара *\"{product.full_name}*\"\n",
+        reply_markup=get_quantity_keyboard(max_qty, "attribute", cancel_to=cancel_to)
+    )
+
+    await state.update_data(category=product.sheet_name, product_name=product.name, attribute=product.attribute,
+                            inline_message_id=response.message_id)
+    if action == "view_edit":
+        await state.update_data(new_action="add_item")
@@ -1,15 +1,58 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile
+from aiogram.fsm.context import FSMContext
+from datetime import datetime
+from typing import Iterable, Tuple
 from io import StringIO
+import asyncio, csv, gzip, os, tempfile
 
 from utils.keyboards import get_statistics_keyboard, get_months_keyboard
 from utils.config import CONFIG
-from utils.shit_utils import format_price
+from utils.shit_utils import format_price, escape_markdown
 from utils.states import StatisticsStates
+from database.read_models import OrderView
 from service.order_service import OrderService
 
 router = Router()
 
+ANALYTICS_TOP_N = 10
+
+@router.message(StatisticsStates.SELECT_PERIOD, F.text == "📈 Аналитика товаров")
+async def analytics_menu(message: Message, state: FSMContext):
+    """Switch period selection to product analytics"""
+    await state.set_state(StatisticsStates.SELECT_ANALYTICS_PERIOD)
+    await message.answer("Выберите период для аналитики по товарам", reply_markup=get_statistics_keyboard())
+
+@router.message(StatisticsStates.SELECT_ANALYTICS_PERIOD)
+async def handle_analytics_period_selection(message: Message, state: FSMContext, order_service: OrderService):
+    """Handle period selection for product analytics"""
+    period = CONFIG.PERIOD_MAP.get(message.text)
+
+    if period == "month":
+        months_data = order_service.get_available_months()
+        await message.answer("Выберите месяц", reply_markup=get_months_keyboard(months_data, "analytics_month"))
+        return
+
+    if not period:
+        await message.answer("Неизвестный период", reply_markup=get_statistics_keyboard())
+        return
+
+    start_date, end_date, period_name = order_service.get_date_period(period)
+    await state.set_state(StatisticsStates.SELECT_PERIOD)
+    await send_sales_analytics(message, order_service, start_date, end_date, period_name, f"analytics_{period}_{start_date.strftime('%Y%m%d')}")
+
+@router.callback_query(F.data.startswith("analytics_month:"))
+async def handle_analytics_month_selection(callback: CallbackQuery, state: FSMContext, order_service: OrderService):
+    """Handle month selection for product analytics"""
+    _, year_str, month_str = callback.data.split(":")
+    year, month = int(year_str), int(month_str)
+
+    start_date, end_date, period_name = order_service.get_month_period(year, month)
+    await callback.message.edit_text(f"Аналитика по товарам за {period_name}")
+    await state.set_state(StatisticsStates.SELECT_PERIOD)
+    await send_sales_analytics(callback.message, order_service, start_date, end_date, period_name, f"analytics_{year}_{month:02d}")
+    await callback.answer()
+
 @router.message(StatisticsStates.SELECT_PERIOD)
 async def handle_period_selection(message: Message, order_service: OrderService):
     """Handle period selection"""
@@ -33,21 +76,7 @@ async def handle_month_selection(callback: CallbackQuery, order_service: OrderSe
     year, month = int(year_str), int(month_str)
 
     start_date, end_date, period_name = order_service.get_month_period(year, month)
-    stats = order_service.get_statistics(start_date, end_date)
-
-    if not stats["orders"]:
-        await callback.message.edit_text(f"Заказы за {period_name} не найдены")
-        return
-
-    await callback.message.edit_text(format_statistics_text(stats, period_name))
-
-    detailed_report = create_detailed_report(stats, period_name)
-    await callback.message.answer_document(
-        BufferedInputFile(detailed_report.getvalue().encode("utf-8"),
-        filename=f"stats_{year}_{month:02d}.txt"),
-        caption="Файл с подробной статистикой по всем заказам за период",
-        reply_markup=get_statistics_keyboard()
-    )
+    await send_period_statistics(callback.message, order_service, start_date, end_date, period_name, f"stats_{year}_{month:02d}", edit=True)
     await callback.answer()
 
 async def show_period_statistics(message: Message, order_service: OrderService, period: str):
@@ -58,23 +87,75 @@ async def show_period_statistics(message: Message, order_service: OrderService,
         await message.answer("Ошибка при получении периода", reply_markup=get_statistics_keyboard())
         return
 
-    stats = order_service.get_statistics(start_date, end_date)
+    await send_period_statistics(message, order_service, start_date, end_date, period_name,
+                                 f"stats_{period}_{start_date.strftime('%Y%m%d')}")
 
-    if not stats["orders"]:
-        await message.answer(f"Заказы за {period_name} не найдены", reply_markup=get_statistics_keyboard())
-        return
+async def send_period_statistics(message: Message, order_service: OrderService, start_date: datetime, end_date: datetime,
+                                 period_name: str, filename: str, edit: bool = False):
+    """Send period totals and the detailed report, both built in one pass over the period's orders"""
+    compress = CONFIG.STATS_REPORT_GZIP
+    # The report streams every order of the period to disk, so it is written off the event loop. The handler waits
+    # for it, so its session is only used by that thread meanwhile; to_thread carries the update's SQL metrics along
+    report_path, stats = await asyncio.to_thread(create_detailed_report, order_service.iter_completed_orders(start_date, end_date),
+                                                 period_name, compress)
 
-    stats_text = format_statistics_text(stats, period_name)
-    detailed_report = create_detailed_report(stats, period_name)
+    try:
+        text = format_statistics_text(stats, period_name) if stats["count"] else f"Заказы за {period_name} не найдены"
+        if edit:
+            await message.edit_text(text)
+        else:
+            await message.answer(text, reply_markup=get_statistics_keyboard())
+        if not stats["count"]:
+            return
+
+        await message.answer_document(
+            FSInputFile(report_path, filename=f"{filename}.txt.gz" if compress else f"{filename}.txt"),
+            caption="Файл с подробной статистикой по всем заказам за период",
+            reply_markup=get_statistics_keyboard()
+        )
+    finally:
+        os.remove(report_path)
+
+async def send_sales_analytics(message: Message, order_service: OrderService, start_date: datetime, end_date: datetime,
+                               period_name: str, filename: str):
+    """Send top products message and full CSV with per-product sales"""
+    analytics = order_service.get_sales_analytics(start_date, end_date)
+
+    if not analytics["products"]:
+        await message.answer(f"Продажи за {period_name} не найдены", reply_markup=get_statistics_keyboard())
+        return
 
-    await message.answer(stats_text, reply_markup=get_statistics_keyboard())
+    await message.answer(format_analytics_text(analytics, period_name), reply_markup=get_statistics_keyboard())
     await message.answer_document(
-        BufferedInputFile(detailed_report.getvalue().encode("utf-8"),
-        filename=f"stats_{period}_{start_date.strftime('%Y%m%d')}.txt"),
-        caption="Файл с подробной статистикой по всем заказам за период",
+        BufferedInputFile(create_analytics_csv(analytics).encode("utf-8-sig"), filename=f"{filename}.csv"),
+        caption="Продажи по всем товарам за период",
         reply_markup=get_statistics_keyboard()
     )
 
+def format_analytics_text(analytics: dict, period_name: str, top_n: int = ANALYTICS_TOP_N) -> str:
+    """Format category totals and top products by revenue"""
+    text = f"📈 *Продажи по товарам за {period_name}*\n\n*Категории:*\n"
+    for category in analytics["categories"]:
+        text += (f"{escape_markdown(category['name'])}: {category['units']} шт, {format_price(category['revenue'])} грн, "
+                 f"маржа {format_price(category['margin'])} грн\n")
+
+    text += f"\n*Топ-{top_n} товаров по выручке:*\n"
+    for i, product in enumerate(analytics["products"][:top_n], 1):
+        text += (f"{i}. {escape_markdown(product['name'])}: {product['units']} шт, {format_price(product['revenue'])} грн, "
+                 f"маржа {format_price(product['margin'])} грн\n")
+
+    return text + "\nКорректировки заказов в марже не учтены"
+
+def create_analytics_csv(analytics: dict) -> str:
+    """Create CSV with sales per product, amounts stay plain numbers so spreadsheets can sum and sort them"""
+    report = StringIO()
+    writer = csv.writer(report, delimiter=";")
+    writer.writerow(["Категория", "Товар", "Продано, шт", "Выручка", "Себестоимость", "Маржа"])
+    for product in analytics["products"]:
+        writer.writerow([product["category"], product["name"], product["units"], round(product["revenue"], 2),
+                         round(product["cost"], 2), round(product["margin"], 2)])
+    return report.getvalue()
+
 def format_statistics_text(stats: dict, period_name: str) -> str:
     """Format statistics text"""
     stats_text = f"📊 *Статистика за {period_name}*\n\n"
@@ -88,30 +169,47 @@ def format_statistics_text(stats: dict, period_name: str) -> str:
     stats_text += f"Прибыль: *{format_price(stats['net_profit'])} грн*"
     return stats_text
 
-def create_detailed_report(stats: dict, period_name: str) -> StringIO:
-    """Create detailed statistics report"""
-    detailed_report = StringIO()
-    detailed_report.write(f"Статистика по заказам за {period_name}\n\n")
-
-    for order in stats["orders"]:
-        detailed_report.write(f"----Заказ {order.display_name}----\n")
-        detailed_report.write(f"Дата завершения: {order.completed_at.strftime('%d.%m.%Y')}\n")
-
-        detailed_report.write("\nТовары:\n")
-        for item in order.items:
-            detailed_report.write(f"- {item.display_name} x{item.quantity}\n")
-
-        if order.adjustments:
-            detailed_report.write(f"\nСумма товаров: {format_price(order.total_items)} грн\n")
+def create_detailed_report(orders: Iterable[OrderView], period_name: str, compress: bool = False) -> Tuple[str, dict]:
+    """Write detailed statistics report order by order to a temp file, return its path and the period totals:
+    count, total_sum, total_cost, total_adjustments and net_profit"""
+    fd, report_path = tempfile.mkstemp(prefix="stats_", suffix=".txt.gz" if compress else ".txt")
+    os.close(fd)
+    stats = {"count": 0, "total_sum": 0, "total_cost": 0, "total_adjustments": 0, "net_profit": 0}
 
-            detailed_report.write("\nКорректировки:\n")
-            for adj in order.adjustments:
-                prefix = "+" if adj.amount > 0 else "-"
-                detailed_report.write(f"{prefix} {format_price(abs(adj.amount))} грн: {adj.reason}\n")
-
-        detailed_report.write(f"\nСумма: {format_price(order.total)} грн\n")
-        detailed_report.write(f"Прибыль: {format_price(order.profit)} грн\n")
-
-        detailed_report.write("\n")
-
-    return detailed_report
+    try:
+        _write_detailed_report(report_path, orders, period_name, compress, stats)
+    except Exception:
+        os.remove(report_path)
+        raise
+    return report_path, stats
+
+def _write_detailed_report(report_path: str, orders: Iterable[OrderView], period_name: str, compress: bool, stats: dict):
+    with (gzip.open if compress else open)(report_path, "wt", encoding="utf-8") as detailed_report:
+        detailed_report.write(f"Статистика по заказам за {period_name}\n\n")
+
+        for order in orders:
+            stats["count"] += 1
+            stats["total_sum"] += order.total
+            stats["total_cost"] += order.total_cost
+            stats["total_adjustments"] += order.total_adjustments
+            stats["net_profit"] += order.profit
+
+            detailed_report.write(f"----Заказ {order.display_name}----\n")
+            detailed_report.write(f"Дата завершения: {order.completed_at.strftime('%d.%m.%Y')}\n")
+
+            detailed_report.write("\nТовары:\n")
+            for item in order.items:
+                detailed_report.write(f"- {item.display_name} x{item.quantity}\n")
+
+            if order.adjustments:
+                detailed_report.write(f"\nСумма товаров: {format_price(order.total_items)} грн\n")
+
+                detailed_report.write("\nКорректировки:\n")
+                for adj in order.adjustments:
+                    prefix = "+" if adj.amount > 0 else "-"
+                    detailed_report.write(f"{prefix} {format_price(abs(adj.amount))} грн: {adj.reason}\n")
+
+            detailed_report.write(f"\nСумма: {format_price(order.total)} грн\n")
+            detailed_report.write(f"Прибыль: {format_price(order.profit)} грн\n")
+
+            detailed_report.write("\n")
@@ -0,0 +1,56 @@
+import argparse, logging
+from sqlalchemy.orm import Session as DbSession
+
+from database.session import init_db, Session
+from repository.order_repository import OrderRepository
+from repository.stock_repository import StockRepository
+from utils.logging_setup import setup_logging
+
+def check_totals(session: DbSession) -> int:
+    mismatches = OrderRepository(session).find_inconsistent_totals()
+    for order_id, column, stored, computed in mismatches:
+        logging.warning(f"Order {order_id}: {column} stored {stored:.2f}, computed {computed:.2f}")
+
+    logging.info(f"Orders with inconsistent totals: {len({order_id for order_id, *_ in mismatches})}")
+    return 1 if mismatches else 0
+
+def backfill_totals(session: DbSession) -> int:
+    logging.info(f"Recalculated totals for {OrderRepository(session).recalculate_totals()} orders")
+    return 0
+
+def check_stock(session: DbSession) -> int:
+    drift = StockRepository(session).find_drift()
+    for product, ledger_quantity in drift:
+        logging.warning(f"{product.sheet_name} / {product.full_name}: stored {product.quantity}, ledger {ledger_quantity}")
+
+    logging.info(f"Products drifted from the stock ledger: {len(drift)}")
+    return 1 if drift else 0
+
+def snapshot_stock(session: DbSession) -> int:
+    logging.info(f"Stock snapshots taken for {StockRepository(session).take_snapshots()} products")
+    return 0
+
+COMMANDS = {
+    "check": check_totals,
+    "backfill": backfill_totals,
+    "stock-check": check_stock,
+    "stock-snapshot": snapshot_stock
+}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Database maintenance")
+    parser.add_argument("command", choices=COMMANDS, help="check: report drifted order totals, "
+        "backfill: recalculate all order totals, "
+        "stock-check: report products drifted from the stock ledger, stock-snapshot: snapshot ledger quantities")
+    args = parser.parse_args()
+
+    init_db()
+    session = Session()
+    try:
+        return COMMANDS[args.command](session)
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
@@ -1,34 +1,214 @@
-from typing import Dict, Any, Callable, Awaitable
+import asyncio, logging, time
+from collections import OrderedDict
+from functools import cached_property
+from typing import Dict, Any, Callable, Awaitable, Iterable, Set, Tuple
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineQuery, Update
+from sqlalchemy.orm import Session as DbSession
 
-from database.session import Session
+from database.session import session_factory
 from repository.product_repository import ProductRepository
 from repository.order_repository import OrderRepository
 from repository.sheets import SheetManager
 from service.product_service import ProductService
 from service.order_service import OrderService
+from utils.metrics import UpdateStats, current_update, HANDLER_SECONDS, HANDLER_ERRORS, DB_QUERIES_PER_UPDATE, \
+    DB_SECONDS_PER_UPDATE, CALLBACK_DUPLICATES
+from utils.sql_profiler import SqlProfile, current_profile
+from utils.update_log import UpdateLogWriter
+
+IDEMPOTENCY_TTL = 2
+SQL_PROFILE_MIN_QUERIES = 10
+SQL_PROFILE_MIN_MS = 100
+SQL_PROFILE_REPEATS = 3
+
+class DependencyContainer:
+    """Per-update dependencies, each one is built on first access"""
+    PROVIDES = ("session", "product_repo", "order_repo", "sheet_manager", "product_service", "order_service")
+
+    def __init__(self, sheet_manager: SheetManager):
+        self.sheet_manager = sheet_manager
+
+    @cached_property
+    def session(self) -> DbSession:
+        # Session does not check out a pool connection until the first query. Not the scoped Session:
+        # it is one per thread, so updates handled concurrently on the loop would share and close it
+        return session_factory()
+
+    @cached_property
+    def product_repo(self) -> ProductRepository:
+        return ProductRepository(self.session)
+
+    @cached_property
+    def order_repo(self) -> OrderRepository:
+        return OrderRepository(self.session)
+
+    @cached_property
+    def product_service(self) -> ProductService:
+        return ProductService(self.product_repo, self.sheet_manager)
+
+    @cached_property
+    def order_service(self) -> OrderService:
+        return OrderService(self.order_repo, self.product_service)
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, Any]:
+        """Build only the dependencies listed in names"""
+        return {name: getattr(self, name) for name in self.PROVIDES if name in names}
+
+    def close(self):
+        if "session" in self.__dict__:
+            self.session.close()
 
 class DependencyMiddleware(BaseMiddleware):
+    """Inner middleware injecting only the dependencies the matched handler declares"""
+
     def __init__(self, sheet_manager: SheetManager):
         super().__init__()
         self.sheet_manager = sheet_manager
 
-    async def __call__(self, handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-            event: Message | CallbackQuery, data: Dict[str, Any]) -> Any:
+    async def __call__(self, handler: Callable[[Message | CallbackQuery | InlineQuery, Dict[str, Any]], Awaitable[Any]],
+            event: Message | CallbackQuery | InlineQuery, data: Dict[str, Any]) -> Any:
+
+        handler_object = data.get("handler")
+        names = DependencyContainer.PROVIDES if not handler_object or handler_object.varkw else handler_object.params
+        container = DependencyContainer(self.sheet_manager)
+
+        try:
+            data.update(container.resolve(names))
+            return await handler(event, data)
+        finally:
+            container.close()
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing handlers and counting SQL statements of each update"""
+
+    async def __call__(self, handler: Callable[[Message | CallbackQuery | InlineQuery, Dict[str, Any]], Awaitable[Any]],
+            event: Message | CallbackQuery | InlineQuery, data: Dict[str, Any]) -> Any:
+
+        handler_object = data.get("handler")
+        callback = handler_object.callback if handler_object else handler
+        labels = {"router": callback.__module__, "handler": callback.__name__}
+
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(**labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, **labels)
+            DB_QUERIES_PER_UPDATE.observe(stats.queries, handler=labels["handler"])
+            DB_SECONDS_PER_UPDATE.observe(stats.seconds, handler=labels["handler"])
+            current_update.reset(token)
+
+class SqlProfilerMiddleware(BaseMiddleware):
+    """Opt-in inner middleware logging SQL counts, time and repeated statement shapes of slow updates"""
+
+    def __init__(self, min_queries: int = SQL_PROFILE_MIN_QUERIES, min_ms: float = SQL_PROFILE_MIN_MS,
+                 min_repeats: int = SQL_PROFILE_REPEATS):
+        super().__init__()
+        self.min_queries = min_queries
+        self.min_ms = min_ms
+        self.min_repeats = min_repeats
+
+    async def __call__(self, handler: Callable[[Message | CallbackQuery | InlineQuery, Dict[str, Any]], Awaitable[Any]],
+            event: Message | CallbackQuery | InlineQuery, data: Dict[str, Any]) -> Any:
+
+        profile = SqlProfile()
+        token = current_profile.set(profile)
+        try:
+            return await handler(event, data)
+        finally:
+            current_profile.reset(token)
+            self._report(data.get("handler"), profile)
+
+    def _report(self, handler_object: Any, profile: SqlProfile):
+        repeated = profile.get_repeated(self.min_repeats)
+        if profile.queries < self.min_queries and profile.seconds * 1000 < self.min_ms and not repeated:
+            return
+
+        name = f"{handler_object.callback.__module__}.{handler_object.callback.__name__}" if handler_object else "unknown"
+        summary = f"SQL profile {name}: {profile.queries} queries, {profile.seconds * 1000:.1f} ms"
+        if repeated:
+            summary += "; repeated: " + " | ".join(f"{count}x {shape}" for shape, count in repeated)
+        logging.warning(summary)
+
+class IdempotencyMiddleware(BaseMiddleware):
+    """Outer callback middleware dropping repeated taps on the same button while it is handled, and shortly after
+    only while the message still looks the same as on the handled tap"""
 
-        session = Session()
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL):
+        super().__init__()
+        self.ttl = ttl
+        self.in_flight: Set[Tuple[int, int, str]] = set()
+        # Last handled tap per message: (callback data, message state, expiry)
+        self.seen: OrderedDict[Tuple[int, int], Tuple[str, int, float]] = OrderedDict()
+        self.chat_locks: Dict[int, asyncio.Lock] = {}
+        self.chat_users: Dict[int, int] = {}
+
+    @staticmethod
+    def get_state(message: Any) -> int:
+        """Hash of message text and buttons as the tap saw them, it changes once a handler edits the message"""
+        markup = getattr(message, "reply_markup", None)
+        buttons = tuple((button.text, button.callback_data) for row in markup.inline_keyboard for button in row) if markup else ()
+        return hash((getattr(message, "text", None), buttons))
+
+    async def __call__(self, handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery, data: Dict[str, Any]) -> Any:
+
+        if not event.message:
+            return await handler(event, data)
+
+        message_key = (event.message.chat.id, event.message.message_id)
+        key, state, now = (*message_key, event.data), self.get_state(event.message), time.monotonic()
+        self._prune(now)
+        last = self.seen.get(message_key)
+        # A tap on an edited message or after another button of it was handled is a new intent, not a duplicate
+        if key in self.in_flight or (last and last[:2] == (event.data, state)):
+            CALLBACK_DUPLICATES.inc()
+            await event.answer()
+            return None
+
+        self.in_flight.add(key)
+        chat_id = key[0]
+        lock = self.chat_locks.setdefault(chat_id, asyncio.Lock())
+        self.chat_users[chat_id] = self.chat_users.get(chat_id, 0) + 1
 
         try:
-            product_repo, order_repo = ProductRepository(session), OrderRepository(session)
-            product_service = ProductService(product_repo, self.sheet_manager)
-            order_service = OrderService(order_repo, product_service)
+            async with lock:
+                return await handler(event, data)
+        finally:
+            self.in_flight.discard(key)
+            if self.ttl:
+                self.seen.pop(message_key, None)
+                self.seen[message_key] = (event.data, state, time.monotonic() + self.ttl)
+            self.chat_users[chat_id] -= 1
+            if not self.chat_users[chat_id]:
+                del self.chat_users[chat_id], self.chat_locks[chat_id]
+
+    def _prune(self, now: float):
+        """Forget taps whose TTL has passed, entries are appended in expiry order"""
+        while self.seen:
+            key, (_, _, expires) = next(iter(self.seen.items()))
+            if expires > now:
+                break
+            del self.seen[key]
 
-            data.update({
-                "session": session, "product_repo": product_repo, "order_repo": order_repo,
-                "sheet_manager": self.sheet_manager, "product_service": product_service, "order_service": order_service
-            })
+class RecorderMiddleware(BaseMiddleware):
+    """Opt-in outer update middleware writing anonymized updates and their handling time for replay"""
 
+    def __init__(self, writer: UpdateLogWriter):
+        super().__init__()
+        self.writer = writer
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]], event: Update, data: Dict[str, Any]) -> Any:
+        arrived, start = time.time(), time.perf_counter()
+        try:
             return await handler(event, data)
         finally:
-            session.close()
+            try:
+                self.writer.write(event, arrived, time.perf_counter() - start)
+            except Exception as e:
+                logging.error(f"Error recording update {event.update_id}: {e}")
@@ -1,10 +1,35 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional, Set, Tuple
+from sqlalchemy.orm import Session, Query, selectinload
+from typing import List, Optional, Set, Tuple, Iterator, Callable, Any, Iterable
 from datetime import datetime, timedelta, date
-from sqlalchemy import extract
+from dataclasses import dataclass, field
+from sqlalchemy import extract, func, tuple_, or_, exists, select, update
 import uuid
+from itertools import islice
 
-from database.models import Order, OrderItem, OrderStatus, ProfitAdjustment
+from database.models import Order, OrderItem, OrderStatus, ProfitAdjustment, Product
+from database.read_models import OrderView, OrderItemView, AdjustmentView
+
+PAGE_SIZE = 15
+TOTALS_TOLERANCE = 0.01
+ORDER_VIEW_COLUMNS = (Order.id, Order.name, Order.status, Order.created_at, Order.completed_at,
+                      Order.total_items, Order.total_cost, Order.total_adjustments, Order.profit)
+# Same fallbacks as OrderItem.display_name
+ITEM_NAME = func.coalesce(OrderItem.product_name, Product.name + " (" + Product.attribute + ")", "Неизвестный товар")
+
+@dataclass
+class OrderPage:
+    orders: List[Tuple[str, str]] = field(default_factory=list)
+    first: Optional[str] = None
+    last: Optional[str] = None
+    has_prev: bool = False
+    has_next: bool = False
+
+def encode_cursor(created_at: datetime, order_id: str) -> str:
+    return f"{created_at.strftime('%Y%m%d%H%M%S%f')}.{order_id}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    created_at, order_id = cursor.split(".", 1)
+    return datetime.strptime(created_at, "%Y%m%d%H%M%S%f"), order_id
 
 class OrderRepository:
     def __init__(self, session: Session):
@@ -14,6 +39,101 @@ class OrderRepository:
         """Get order by ID"""
         return self.session.query(Order).filter(Order.id == order_id).first()
 
+    def get_order_view(self, order_id: str) -> Optional[OrderView]:
+        """Get read-only order with items and adjustments for rendering"""
+        # Order columns ride along with its items, one round trip less than a separate order query
+        rows = self.session.query(*ORDER_VIEW_COLUMNS, ITEM_NAME, OrderItem.quantity, OrderItem.price).outerjoin(
+            OrderItem, OrderItem.order_id == Order.id
+        ).outerjoin(
+            Product, OrderItem.product_id == Product.id
+        ).filter(Order.id == order_id).order_by(OrderItem.id).all()
+        if not rows:
+            return None
+
+        columns = len(ORDER_VIEW_COLUMNS)
+        order = OrderView(*rows[0][:columns])
+        order.items = [OrderItemView(*row[columns:]) for row in rows if row.quantity is not None]
+        order.adjustments = [AdjustmentView(*row) for row in self.session.query(
+            ProfitAdjustment.amount, ProfitAdjustment.reason, ProfitAdjustment.affects_total
+        ).filter(ProfitAdjustment.order_id == order_id).order_by(ProfitAdjustment.id)]
+        return order
+
+    def _load_views(self, rows: Iterable[Any]) -> List[OrderView]:
+        """Build order views from ORDER_VIEW_COLUMNS rows with two projected queries for their items and adjustments"""
+        views = {row.id: OrderView(*row) for row in rows}
+        if not views:
+            return []
+
+        items = self.session.query(OrderItem.order_id, ITEM_NAME, OrderItem.quantity, OrderItem.price).outerjoin(
+            Product, OrderItem.product_id == Product.id
+        ).filter(OrderItem.order_id.in_(views)).order_by(OrderItem.id)
+        for order_id, display_name, quantity, price in items:
+            views[order_id].items.append(OrderItemView(display_name, quantity, price))
+
+        adjustments = self.session.query(
+            ProfitAdjustment.order_id, ProfitAdjustment.amount, ProfitAdjustment.reason, ProfitAdjustment.affects_total
+        ).filter(ProfitAdjustment.order_id.in_(views)).order_by(ProfitAdjustment.id)
+        for order_id, amount, reason, affects_total in adjustments:
+            views[order_id].adjustments.append(AdjustmentView(amount, reason, affects_total))
+
+        return list(views.values())
+
+    def get_by_ids(self, order_ids: List[str]) -> List[Order]:
+        """Get orders by IDs with their items"""
+        return self.session.query(Order).options(selectinload(Order.items)).filter(
+            Order.id.in_(order_ids)
+        ).order_by(Order.created_at, Order.id).all()
+
+    @staticmethod
+    def _get_page(query: Query, cursor: Optional[str], backward: bool, limit: int, newest_first: bool = False,
+                  label: Callable[[Any], str] = lambda row: row.name or row.id) -> OrderPage:
+        """Keyset pagination over (created_at, id) starting after (or before, when backward) the cursor"""
+        key = tuple_(Order.created_at, Order.id)
+        ascending = newest_first == backward
+
+        if cursor:
+            value = tuple_(*decode_cursor(cursor))
+            query = query.filter(key > value if ascending else key < value)
+
+        if ascending:
+            query = query.order_by(Order.created_at.asc(), Order.id.asc())
+        else:
+            query = query.order_by(Order.created_at.desc(), Order.id.desc())
+
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+
+        if not rows:
+            return OrderPage()
+
+        return OrderPage(
+            orders=[(row.id, label(row)) for row in rows],
+            first=encode_cursor(rows[0].created_at, rows[0].id),
+            last=encode_cursor(rows[-1].created_at, rows[-1].id),
+            has_prev=has_more if backward else cursor is not None,
+            has_next=cursor is not None if backward else has_more
+        )
+
+    def search_orders(self, text: str, cursor: Optional[str] = None, backward: bool = False, limit: int = PAGE_SIZE) -> OrderPage:
+        """Search all orders by name, id or item names, newest first"""
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+
+        query = self.session.query(Order.id, Order.name, Order.created_at, Order.status).filter(or_(
+            Order.name.ilike(pattern, escape="\\"),
+            Order.id.ilike(f"{escaped}%", escape="\\"),
+            exists().where(OrderItem.order_id == Order.id, OrderItem.product_name.ilike(pattern, escape="\\"))
+        ))
+
+        def label(row) -> str:
+            mark = "✅" if row.status == OrderStatus.COMPLETED else "🟢"
+            return f"{mark} {row.name or row.id} · {row.created_at.strftime('%d.%m.%y')}"
+
+        return self._get_page(query, cursor, backward, limit, newest_first=True, label=label)
+
     def get_active_order_names_list(self) -> List[str]:
         """Get names of active orders only"""
         return [order.name for order in self.session.query(Order.name).filter(
@@ -21,12 +141,12 @@ class OrderRepository:
             Order.name.isnot(None)
         ).all()]
 
-    def get_active_order_names(self) -> List[Tuple[str, str]]:
-        """Get names of all active orders"""
-        active_orders = self.session.query(Order).filter(
+    def get_active_orders_page(self, cursor: Optional[str] = None, backward: bool = False, limit: int = PAGE_SIZE) -> OrderPage:
+        """Get a page of active orders (id, display_name) ordered by creation time"""
+        query = self.session.query(Order.id, Order.name, Order.created_at).filter(
             Order.status == OrderStatus.PENDING
-        ).all()
-        return [(order.id, order.display_name) for order in active_orders]
+        )
+        return self._get_page(query, cursor, backward, limit)
 
     def get_completed_dates(self, days_limit: int) -> Set[date]:
         """Get set of dates when orders were completed within the last N days"""
@@ -38,18 +158,18 @@ class OrderRepository:
 
         return {order.completed_at.date() for order in completed_orders if order.completed_at}
 
-    def get_completed_order_names_by_date(self, date_value: date) -> List[Tuple[str, str]]:
-        """Get completed orders with display names by date (id, display_name)"""
-        next_day = datetime.combine(date_value, datetime.min.time()) + timedelta(days=1)
+    def get_completed_orders_page_by_date(self, date_value: date, cursor: Optional[str] = None, backward: bool = False,
+                                          limit: int = PAGE_SIZE) -> OrderPage:
+        """Get a page of orders (id, display_name) completed on a date"""
         day_start = datetime.combine(date_value, datetime.min.time())
+        next_day = day_start + timedelta(days=1)
 
-        valid_orders = self.session.query(Order).filter(
+        query = self.session.query(Order.id, Order.name, Order.created_at).filter(
             Order.status == OrderStatus.COMPLETED,
             Order.completed_at >= day_start,
             Order.completed_at < next_day
-        ).all()
-
-        return [(order.id, order.display_name) for order in valid_orders]
+        )
+        return self._get_page(query, cursor, backward, limit)
 
     def get_months_with_completed_orders(self) -> List[Tuple[int, int]]:
         """Get months with completed orders (year, month)"""
@@ -63,12 +183,38 @@ class OrderRepository:
 
         return [(int(r.year), int(r.month)) for r in result]
 
-    def get_completed_orders_by_period(self, start_date: datetime, end_date: datetime) -> List[Order]:
-        """Get completed orders between two dates"""
-        return self.session.query(Order).filter(
+    def iter_completed_orders_by_period(self, start_date: datetime, end_date: datetime, batch_size: int = 500) -> Iterator[OrderView]:
+        """Stream completed orders between two dates as read-only views with a server-side cursor"""
+        rows = iter(self.session.query(*ORDER_VIEW_COLUMNS).filter(
             Order.status == OrderStatus.COMPLETED,
             Order.completed_at.between(start_date, end_date)
-        ).all()
+        ).order_by(Order.completed_at, Order.id).yield_per(batch_size))
+
+        while batch := list(islice(rows, batch_size)):
+            yield from self._load_views(batch)
+
+    def get_product_sales(self, start_date: datetime, end_date: datetime) -> List[Tuple[Optional[str], str, int, float, float]]:
+        """Get units, revenue and cost per product sold in completed orders between two dates"""
+        revenue = func.sum(OrderItem.price * OrderItem.quantity)
+
+        result = self.session.query(
+            Product.sheet_name.label("category"),
+            ITEM_NAME.label("product_name"),
+            func.sum(OrderItem.quantity).label("units"),
+            revenue.label("revenue"),
+            func.sum(OrderItem.cost * OrderItem.quantity).label("cost")
+        ).join(
+            Order, OrderItem.order_id == Order.id
+        ).outerjoin(
+            Product, OrderItem.product_id == Product.id
+        ).filter(
+            Order.status == OrderStatus.COMPLETED,
+            Order.completed_at.between(start_date, end_date)
+        ).group_by(
+            Product.sheet_name, OrderItem.product_name, Product.name, Product.attribute
+        ).order_by(revenue.desc()).all()
+
+        return [(r.category, r.product_name, int(r.units), float(r.revenue), float(r.cost)) for r in result]
 
     def create_order(self) -> Order:
         """Create a new pending order"""
@@ -93,6 +239,7 @@ class OrderRepository:
 
         if existing_item:
             existing_item.quantity += quantity
+            self._apply_item_delta(order.id, existing_item.price, existing_item.cost, quantity)
         else:
             item = OrderItem(
                 order_id=order.id,
@@ -103,38 +250,54 @@ class OrderRepository:
                 cost=cost
             )
             self.session.add(item)
+            self._apply_item_delta(order.id, price, cost, quantity)
 
         self.session.commit()
 
     def update_item_quantity(self, item: OrderItem, quantity: int) -> OrderItem:
         """Update order item quantity"""
+        self._apply_item_delta(item.order_id, item.price, item.cost, quantity - item.quantity)
         item.quantity = quantity
         self.session.commit()
         return item
 
     def remove_item(self, item: OrderItem) -> None:
         """Remove item from order"""
+        self._apply_item_delta(item.order_id, item.price, item.cost, -item.quantity)
         self.session.delete(item)
         self.session.commit()
 
-    def complete_order(self, order: Order, completion_date: datetime = None) -> Order:
-        """Complete an order with optional specific date"""
-        order.status = OrderStatus.COMPLETED
-        order.completed_at = completion_date or datetime.now()
-        self.session.commit()
-        return order
+    def complete_order(self, order: Order, completion_date: datetime = None, commit: bool = True) -> bool:
+        """Complete a pending order with optional specific date, returns False if it was completed meanwhile"""
+        return bool(self.complete_orders([order.id], completion_date, commit))
+
+    def complete_orders(self, order_ids: List[str], completion_date: datetime = None, commit: bool = True) -> List[str]:
+        """Complete several pending orders with one UPDATE, returns ids of the orders it completed.
+
+        commit=False leaves the change in the transaction so it commits together with the stock ledger"""
+        # Rows completed meanwhile by another worker no longer match the status filter and are not returned
+        completed = self.session.execute(update(Order).where(
+            Order.id.in_(order_ids),
+            Order.status == OrderStatus.PENDING
+        ).values(status=OrderStatus.COMPLETED, completed_at=completion_date or datetime.now()).returning(Order.id),
+            execution_options={"synchronize_session": False}).scalars().all()
+        if commit:
+            self.session.commit()
+        return completed
 
-    def restore_order(self, order: Order) -> Order:
+    def restore_order(self, order: Order, commit: bool = True) -> Order:
         """Restore a completed order to pending state"""
         order.status = OrderStatus.PENDING
         order.completed_at = None
-        self.session.commit()
+        if commit:
+            self.session.commit()
         return order
 
-    def delete_order(self, order: Order) -> None:
+    def delete_order(self, order: Order, commit: bool = True) -> None:
         """Delete an order"""
         self.session.delete(order)
-        self.session.commit()
+        if commit:
+            self.session.commit()
 
     def get_order_item(self, item_id: int) -> Optional[OrderItem]:
         """Get order item by ID"""
@@ -150,6 +313,7 @@ class OrderRepository:
             affects_total=affects_total
         )
         self.session.add(adjustment)
+        self._apply_adjustment_delta(adjustment, 1)
         self.session.commit()
         return adjustment
 
@@ -172,5 +336,67 @@ class OrderRepository:
         ).first()
 
         if adjustment:
+            self._apply_adjustment_delta(adjustment, -1)
             self.session.delete(adjustment)
             self.session.commit()
+
+    def _apply_item_delta(self, order_id: str, price: float, cost: float, quantity: int) -> None:
+        """Shift stored order totals by a change in item quantity"""
+        # Increment in SQL so concurrent edits of one order from different workers do not overwrite each other
+        self.session.query(Order).filter(Order.id == order_id).update({
+            Order.total_items: Order.total_items + price * quantity,
+            Order.total_cost: Order.total_cost + cost * quantity,
+            Order.profit: Order.profit + (price - cost) * quantity
+        }, synchronize_session=False)
+
+    def _apply_adjustment_delta(self, adjustment: ProfitAdjustment, sign: int) -> None:
+        """Shift stored order totals by an added (1) or removed (-1) adjustment"""
+        profit_amount = adjustment.profit_amount if adjustment.profit_amount is not None else adjustment.amount
+        values = {Order.profit: Order.profit + sign * profit_amount}
+        if adjustment.affects_total:
+            values[Order.total_adjustments] = Order.total_adjustments + sign * adjustment.amount
+
+        self.session.query(Order).filter(Order.id == adjustment.order_id).update(values, synchronize_session=False)
+
+    @staticmethod
+    def _get_computed_totals():
+        """Correlated subqueries computing order totals from items and adjustments"""
+        total_items = select(func.coalesce(func.sum(OrderItem.price * OrderItem.quantity), 0)).where(
+            OrderItem.order_id == Order.id).scalar_subquery()
+        total_cost = select(func.coalesce(func.sum(OrderItem.cost * OrderItem.quantity), 0)).where(
+            OrderItem.order_id == Order.id).scalar_subquery()
+        total_adjustments = select(func.coalesce(func.sum(ProfitAdjustment.amount), 0)).where(
+            ProfitAdjustment.order_id == Order.id, ProfitAdjustment.affects_total.is_(True)).scalar_subquery()
+        profit_adjustments = select(func.coalesce(func.sum(func.coalesce(ProfitAdjustment.profit_amount, ProfitAdjustment.amount)), 0)).where(
+            ProfitAdjustment.order_id == Order.id).scalar_subquery()
+
+        return {
+            Order.total_items: total_items,
+            Order.total_cost: total_cost,
+            Order.total_adjustments: total_adjustments,
+            Order.profit: total_items - total_cost + profit_adjustments
+        }
+
+    def find_inconsistent_totals(self, tolerance: float = TOTALS_TOLERANCE) -> List[Tuple[str, str, float, float]]:
+        """Get (order id, column, stored, computed) for every stored total that drifted from its items"""
+        computed = self._get_computed_totals()
+        rows = self.session.query(Order.id, *computed.keys(), *computed.values()).all()
+
+        columns = [column.key for column in computed]
+        mismatches = []
+        for row in rows:
+            stored, actual = row[1:len(columns) + 1], row[len(columns) + 1:]
+            for column, stored_value, actual_value in zip(columns, stored, actual):
+                if abs(stored_value - actual_value) > tolerance:
+                    mismatches.append((row[0], column, stored_value, actual_value))
+        return mismatches
+
+    def recalculate_totals(self, order_ids: Optional[List[str]] = None) -> int:
+        """Recompute stored totals from items and adjustments, returns number of updated orders"""
+        query = self.session.query(Order)
+        if order_ids is not None:
+            query = query.filter(Order.id.in_(order_ids))
+
+        updated = query.update(self._get_computed_totals(), synchronize_session=False)
+        self.session.commit()
+        return updated
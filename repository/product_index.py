@@ -0,0 +1,83 @@
+import heapq, re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+
+from database.models import Product
+
+MIN_SCORE = 0.3
+CANDIDATES_PER_RESULT = 5
+
+@dataclass(frozen=True)
+class IndexedProduct:
+    id: int
+    sheet_name: str
+    name: str
+    attribute: str
+    price: float
+    words: Tuple[str, ...]
+
+    @property
+    def full_name(self):
+        return f"{self.name} ({self.attribute})"
+
+def normalize(text: str) -> str:
+    """Lowercase text and keep only letters and digits"""
+    return re.sub(r"[^\w]+", " ", text.lower().replace("ё", "е")).strip()
+
+def get_trigrams(text: str) -> Set[str]:
+    """Word trigrams padded like pg_trgm, so short prefixes match too"""
+    trigrams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+class ProductIndex:
+    """In-memory trigram index over product names and attributes"""
+
+    def __init__(self):
+        self._state: Tuple[Dict[int, IndexedProduct], Dict[str, List[int]]] = ({}, {})
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def rebuild(self, products: Iterable[Product]):
+        """Build a fresh index and swap it in one assignment"""
+        indexed, postings = {}, defaultdict(list)
+
+        for product in products:
+            text = f"{product.name} {product.attribute}"
+            indexed[product.id] = IndexedProduct(product.id, product.sheet_name, product.name, product.attribute,
+                                                 product.price, tuple(normalize(text).split()))
+            for trigram in get_trigrams(text):
+                postings[trigram].append(product.id)
+
+        self._state = (indexed, dict(postings))
+
+    def search(self, query: str, limit: int = 20) -> List[IndexedProduct]:
+        """Products ranked by share of matched trigrams, word prefix matches first"""
+        products, postings = self._state
+        query_trigrams = get_trigrams(query)
+        if not query_trigrams:
+            return []
+
+        hits = Counter()
+        for trigram in query_trigrams:
+            hits.update(postings.get(trigram, ()))
+
+        query_words = normalize(query).split()
+        min_hits = MIN_SCORE * len(query_trigrams)
+        scored = []
+        for product_id, count in hits.most_common(limit * CANDIDATES_PER_RESULT):
+            product = products.get(product_id)
+            if count < min_hits or not product:
+                continue
+
+            score = count / len(query_trigrams)
+            if all(any(word.startswith(query_word) for word in product.words) for query_word in query_words):
+                score += 1
+            scored.append((score, product))
+
+        best = heapq.nlargest(limit, scored, key=lambda entry: (entry[0], -len(entry[1].full_name)))
+        return [product for _, product in best]
@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import func
+from typing import Dict, Iterable, List, Optional
 
-from database.models import Product
+from database.models import Product, Order, OrderItem, OrderStatus, MovementReason, SheetCategory
+from repository.stock_repository import StockRepository, SOURCE_BOT
 
 class ProductRepository:
     def __init__(self, session: Session):
@@ -11,6 +13,10 @@ class ProductRepository:
         """Get product by ID"""
         return self.session.query(Product).filter(Product.id == product_id).first()
 
+    def get_by_ids(self, product_ids: Iterable[int]) -> List[Product]:
+        """Get products by IDs"""
+        return self.session.query(Product).filter(Product.id.in_(list(product_ids))).all()
+
     def get_by_name_attribute(self, sheet_name: str, name: str, attribute: str) -> Optional[Product]:
         """Get product by category, name and attribute"""
         return self.session.query(Product).filter(
@@ -31,6 +37,66 @@ class ProductRepository:
         self.session.commit()
         return product
 
+    def get_categories(self) -> Dict[str, str]:
+        """Get attribute header of every worksheet in sheet order"""
+        return dict(self.session.query(SheetCategory.sheet_name, SheetCategory.attribute).order_by(SheetCategory.position))
+
+    def save_categories(self, categories: Dict[str, str]):
+        """Replace saved worksheets and their attribute headers"""
+        self.session.query(SheetCategory).delete()
+        self.session.add_all(SheetCategory(sheet_name=sheet_name, attribute=attribute, position=position)
+                             for position, (sheet_name, attribute) in enumerate(categories.items()))
+        self.session.commit()
+
+    def _get_reserved_subquery(self):
+        """Quantity of every product held by pending orders"""
+        return self.session.query(
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity).label("reserved")
+        ).join(Order).filter(Order.status == OrderStatus.PENDING, OrderItem.product_id.isnot(None)).group_by(OrderItem.product_id).subquery()
+
+    def _filter_available(self, query):
+        """Keep only products with unreserved stock"""
+        reserved = self._get_reserved_subquery()
+        return query.outerjoin(reserved, reserved.c.product_id == Product.id).filter(
+            Product.quantity - func.coalesce(reserved.c.reserved, 0) > 0)
+
+    def get_reserved_quantity(self, product_id: int) -> int:
+        """Get quantity of product reserved by pending orders"""
+        return self.session.query(func.coalesce(func.sum(OrderItem.quantity), 0)).join(Order).filter(
+            OrderItem.product_id == product_id,
+            Order.status == OrderStatus.PENDING
+        ).scalar()
+
+    def get_reserved_quantities(self) -> Dict[int, int]:
+        """Get reserved quantity of every product held by pending orders"""
+        reserved = self._get_reserved_subquery()
+        return {product_id: quantity for product_id, quantity in self.session.query(reserved.c.product_id, reserved.c.reserved)}
+
+    def adjust_quantities(self, deltas: Dict[int, int], reason: MovementReason, source: str = SOURCE_BOT,
+                          order_id: str = None) -> List[Product]:
+        """Shift on-hand quantities by product ID and log the movements in one transaction, return updated products"""
+        return self.adjust_order_quantities({order_id: deltas}, reason, source)
+
+    def adjust_order_quantities(self, order_deltas: Dict[Optional[str], Dict[int, int]], reason: MovementReason,
+                                source: str = SOURCE_BOT) -> List[Product]:
+        """Shift on-hand quantities of several orders in one transaction, logging a movement per order and product"""
+        stock_repo = StockRepository(self.session)
+        totals = {}
+        for order_id, deltas in order_deltas.items():
+            for product_id, delta in deltas.items():
+                stock_repo.add_movement(product_id, delta, reason, source, order_id)
+                totals[product_id] = totals.get(product_id, 0) + delta
+
+        for product_id, delta in totals.items():
+            self.session.query(Product).filter(Product.id == product_id).update(
+                {Product.quantity: Product.quantity + delta}, synchronize_session=False)
+        self.session.commit()
+
+        if not totals:
+            return []
+        return self.session.query(Product).filter(Product.id.in_(totals)).all()
+
     def get_unique_categories(self) -> List[str]:
         """Get all unique product categories (excluding archived)"""
         return [r[0] for r in self.session.query(Product.sheet_name).filter(
@@ -44,7 +110,7 @@ class ProductRepository:
         )
 
         if not include_zero_qty:
-            query = query.filter(Product.quantity > 0)
+            query = self._filter_available(query)
 
         return [r[0] for r in query.distinct()]
 
@@ -57,7 +123,7 @@ class ProductRepository:
         )
 
         if not include_zero_qty:
-            query = query.filter(Product.quantity > 0)
+            query = self._filter_available(query)
 
         return [r[0] for r in query]
 
@@ -68,6 +134,10 @@ class ProductRepository:
             Product.is_archived == False
         ).all()
 
+    def get_all_active(self) -> List[Product]:
+        """Get all non-archived products"""
+        return self.session.query(Product).filter(Product.is_archived == False).all()
+
     def archive_product(self, product: Product) -> Product:
         """Archive a product"""
         product.is_archived = True
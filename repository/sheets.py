@@ -1,14 +1,26 @@
-import gspread, logging, asyncio, time
+import logging, asyncio, time, queue
 from google.auth.exceptions import RefreshError
 from gspread.exceptions import APIError
 from sqlalchemy.orm import Session
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from concurrent.futures import ThreadPoolExecutor
-from typing import Set, Callable, Any
+from typing import Set, Callable, Any, Optional, List
 
-from utils.config import CONFIG, get_credentials
-from database.models import Product
+from utils.config import CONFIG
+from database.models import Product, MovementReason
 from repository.product_repository import ProductRepository
+from repository.stock_repository import StockRepository, SOURCE_SHEET
+from repository.product_index import ProductIndex
+from repository.sheets_backend import SheetsBackend, GspreadBackend, build_a1_range
+from repository.sheets_trace import SheetsTracer, TracedBackend
+from utils.metrics import SHEET_QUEUE_DEPTH, SHEET_QUEUE_AGE_SECONDS, SYNC_SECONDS, SYNC_ROWS_CHANGED
+
+SNAPSHOT_INTERVAL = 60 * 60
+QUOTA_LOG_INTERVAL = 5 * 60
+CATEGORIES_WAIT = 60
+RETRY_BASE_DELAY = 1
+# Logged for every stock change, sampled through LOG_SAMPLE
+QUEUE_LOG = logging.getLogger("sheets.queue")
 
 @dataclass
 class QuantityUpdate:
@@ -16,47 +28,73 @@ class QuantityUpdate:
     new_quantity: int
     sheet_name: str
     sheet_row: int
+    queued_at: float = field(default_factory=time.time)
 
 class SheetManager:
-    def __init__(self, db_session: Session):
-        self.db_session = db_session
-        self.product_repo = ProductRepository(db_session)
-        self.client = self.get_client()
-        self.sheet = None
-        self.product_sheets = {}
+    def __init__(self, session_factory: Callable[[], Session], is_owner: bool = True, forward_queue: Optional[Any] = None,
+                 backend: Optional[SheetsBackend] = None):
+        """is_owner marks the single process allowed to sync and write the sheets; the others
+        push their updates into forward_queue (a multiprocessing queue drained by the owner).
+
+        Sessions are not thread-safe, so every operation opens its own from session_factory"""
+        self.session_factory = session_factory
+        self.is_owner = is_owner
+        self.forward_queue = forward_queue
+        self.tracer = SheetsTracer()
+        self.backend = TracedBackend(backend or GspreadBackend(), self.tracer)
+        self.product_sheets: List[str] = []
+        self.retry_delay = RETRY_BASE_DELAY
+        self.product_index = ProductIndex()
 
         self.update_queue = asyncio.Queue()
         self.executor = ThreadPoolExecutor(max_workers=4)
         self.sync_task = None
         self.queue_task = None
+        self.forward_task = None
+        self.last_snapshot = time.monotonic()
+        self.last_quota_log = time.monotonic()
 
-        self._init_sheets()
+        # Only the owner opens the spreadsheet, the others read the headers it saved to spare the read quota
+        if is_owner:
+            self._init_sheets()
+        else:
+            self.load_categories()
+        self.rebuild_index()
 
     def _init_sheets(self):
-        """Initialize Google Sheets client and worksheets"""
-        self.sheet = self.client.open_by_key(CONFIG.SHEET_ID)
-        self.product_sheets = {sheet.title: sheet for sheet in self.sheet.worksheets() if sheet.title != CONFIG.EXCLUDED_SHEET}
-
-        for sheet_name, worksheet in self.product_sheets.items():
-            header = worksheet.row_values(1)
-            CONFIG.PRODUCT_CATEGORIES[sheet_name] = header[CONFIG.COL_ATTRIBUTE]
-
-    @staticmethod
-    def get_client() -> gspread.Client:
-        """Get Google Sheets client"""
-        return gspread.service_account_from_dict(info=get_credentials(), scopes=CONFIG.SCOPES)
+        """Open the spreadsheet, read category attributes from worksheet headers and save them for the other workers"""
+        self.backend.connect()
+        self.product_sheets = [title for title in self.backend.get_titles() if title != CONFIG.EXCLUDED_SHEET]
+
+        categories = {sheet_name: self.backend.row_values(sheet_name, 1)[CONFIG.COL_ATTRIBUTE] for sheet_name in self.product_sheets}
+        # Keyboards iterate the categories on the loop thread, so a complete dict is swapped in instead of filled in place
+        CONFIG.PRODUCT_CATEGORIES = categories
+        with self.session_factory() as session:
+            ProductRepository(session).save_categories(categories)
+
+    def load_categories(self):
+        """Read category attributes saved by the owner"""
+        try:
+            with self.session_factory() as session:
+                categories = ProductRepository(session).get_categories()
+            self.product_sheets = list(categories)
+            CONFIG.PRODUCT_CATEGORIES = categories
+        except Exception as e:
+            logging.error(f"Error loading categories: {e}")
 
     def retry_with_backoff(self, func: Callable, *args, max_retries: int = 3, **kwargs) -> Any:
         """Execute function with exponential backoff retry on auth errors"""
+        # Calls are counted and timed once, by the traced backend
         for attempt in range(max_retries):
             try:
-                return func(*args, **kwargs)
+                with self.backend.attempt(attempt):
+                    return func(*args, **kwargs)
             except (RefreshError, APIError):
                 if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
+                    wait_time = self.retry_delay * 2 ** attempt
                     time.sleep(wait_time)
-                    self.client = self.get_client()
-                    self._init_sheets()
+                    with self.backend.attempt(attempt + 1):
+                        self._init_sheets()
                 else:
                     logging.error("Max retries reached in retry_with_backoff")
             except Exception as e:
@@ -66,70 +104,92 @@ class SheetManager:
     async def sync_products(self):
         """Async product sync with sequential sheet processing for DB safety"""
         try:
-            loop = asyncio.get_event_loop()
-            for sheet_name, worksheet in self.product_sheets.items():
-                await loop.run_in_executor(self.executor, self._sync_sheet_products, sheet_name, worksheet)
+            with SYNC_SECONDS.time():
+                loop = asyncio.get_event_loop()
+                for sheet_name in self.product_sheets:
+                    await loop.run_in_executor(self.executor, self._sync_sheet_products, sheet_name)
+                await loop.run_in_executor(self.executor, self.rebuild_index)
         except Exception as e:
             logging.error(f"Error in sync_products: {e}")
 
-    def _sync_sheet_products(self, sheet_name: str, worksheet: gspread.Worksheet):
+    def rebuild_index(self):
+        """Rebuild product search index from the database"""
+        try:
+            with self.session_factory() as session:
+                self.product_index.rebuild(ProductRepository(session).get_all_active())
+        except Exception as e:
+            logging.error(f"Error rebuilding product index: {e}")
+
+    def _sync_sheet_products(self, sheet_name: str):
         """Sync products from specific worksheet"""
         try:
-            data = self.retry_with_backoff(worksheet.get_all_values)
-            if len(data) <= 1:
+            data = self.retry_with_backoff(self.backend.get_all_values, sheet_name)
+            if not data or len(data) <= 1:
                 return
 
-            sheet_products: Set[tuple] = set()
-
-            for i, row in enumerate(data[1:], start=2):
-                if len(row) < CONFIG.COL_COST + 1:
-                    continue
+            with self.session_factory() as session:
+                product_repo, stock_repo = ProductRepository(session), StockRepository(session)
+                sheet_products: Set[tuple] = set()
 
-                try:
-                    name, attribute = row[CONFIG.COL_PRODUCT], row[CONFIG.COL_ATTRIBUTE]
-                    if not name or not attribute:
+                for i, row in enumerate(data[1:], start=2):
+                    if len(row) < CONFIG.COL_COST + 1:
                         continue
 
-                    quantity, price, cost = int(row[CONFIG.COL_QUANTITY]), float(row[CONFIG.COL_PRICE]), float(row[CONFIG.COL_COST])
-                    sheet_products.add((name, attribute))
-                    product = self.product_repo.get_by_name_attribute(sheet_name, name, attribute)
-
-                    if product:
-                        if product.is_archived:
-                            self.product_repo.unarchive_product(product)
-
-                        needs_update = (product.quantity != quantity or product.price != price or
-                            product.cost != cost or product.sheet_row != i)
-
-                        if needs_update:
-                            product.name, product.attribute, product.quantity = name, attribute, quantity
-                            product.price, product.cost, product.sheet_row = price, cost, i
-                            self.product_repo.update(product)
-                    else:
-                        product = Product(sheet_name=sheet_name, sheet_row=i, name=name,
-                                          attribute=attribute, quantity=quantity, price=price, cost=cost)
-                        self.product_repo.create(product)
-
-                except (ValueError, IndexError) as e:
-                    logging.warning(f"Row {i} in {sheet_name}: {e}")
-
-            for product in self.product_repo.get_all_by_sheet(sheet_name):
-                if (product.name, product.attribute) not in sheet_products:
-                    self.product_repo.archive_product(product)
+                    try:
+                        name, attribute = row[CONFIG.COL_PRODUCT], row[CONFIG.COL_ATTRIBUTE]
+                        if not name or not attribute:
+                            continue
+
+                        quantity, price, cost = int(row[CONFIG.COL_QUANTITY]), float(row[CONFIG.COL_PRICE]), float(row[CONFIG.COL_COST])
+                        sheet_products.add((name, attribute))
+                        product = product_repo.get_by_name_attribute(sheet_name, name, attribute)
+
+                        if product:
+                            if product.is_archived:
+                                product_repo.unarchive_product(product)
+                                SYNC_ROWS_CHANGED.inc(change="unarchived")
+
+                            needs_update = (product.quantity != quantity or product.price != price or
+                                product.cost != cost or product.sheet_row != i)
+
+                            if needs_update:
+                                stock_repo.add_movement(product.id, quantity - (product.quantity or 0), MovementReason.SYNC, SOURCE_SHEET)
+                                product.name, product.attribute, product.quantity = name, attribute, quantity
+                                product.price, product.cost, product.sheet_row = price, cost, i
+                                product_repo.update(product)
+                                SYNC_ROWS_CHANGED.inc(change="updated")
+                        else:
+                            product = Product(sheet_name=sheet_name, sheet_row=i, name=name,
+                                              attribute=attribute, quantity=quantity, price=price, cost=cost)
+                            product_repo.create(product)
+                            stock_repo.add_movement(product.id, quantity, MovementReason.INITIAL, SOURCE_SHEET)
+                            session.commit()
+                            SYNC_ROWS_CHANGED.inc(change="created")
+
+                    except (ValueError, IndexError) as e:
+                        logging.warning(f"Row {i} in {sheet_name}: {e}")
+
+                for product in product_repo.get_all_by_sheet(sheet_name):
+                    if (product.name, product.attribute) not in sheet_products:
+                        product_repo.archive_product(product)
+                        SYNC_ROWS_CHANGED.inc(change="archived")
 
         except Exception as e:
             logging.error(f"Error syncing {sheet_name}: {e}")
 
-    def queue_quantity_update(self, product: Product, new_quantity: int) -> bool:
+    def queue_quantity_updates(self, products: List[Product]) -> bool:
+        """Queue current quantities of already saved products as one sheet write"""
         try:
-            product.quantity = new_quantity
-            self.product_repo.update(product)
-            logging.info(f"Queued update for product {product.full_name}")
+            updates = [QuantityUpdate(product.id, product.quantity, product.sheet_name, product.sheet_row) for product in products]
+            QUEUE_LOG.info("Queued sheet update for %d products", len(updates), extra={"products": tuple(update.product_id for update in updates)})
 
-            update = QuantityUpdate(product.id, new_quantity, product.sheet_name, product.sheet_row)
+            if not self.is_owner:
+                self.forward_queue.put(updates)
+                return True
 
             try:
-                self.update_queue.put_nowait(update)
+                self.update_queue.put_nowait(updates)
+                SHEET_QUEUE_DEPTH.set(self.update_queue.qsize())
                 return True
             except asyncio.QueueFull:
                 logging.warning("Update queue full, skipping sheet update")
@@ -140,46 +200,88 @@ class SheetManager:
             return False
 
     async def _process_update_queue(self):
-        """Process sheet updates from queue"""
+        """Process sheet update batches from queue"""
         while True:
             try:
-                update = await self.update_queue.get()
-                await self._process_single_update(update)
+                updates = await self.update_queue.get()
+                SHEET_QUEUE_DEPTH.set(self.update_queue.qsize())
+                SHEET_QUEUE_AGE_SECONDS.observe(time.time() - min(update.queued_at for update in updates))
+                await self._process_batch(updates)
                 self.update_queue.task_done()
             except Exception as e:
                 logging.error(f"Queue processing error: {e}")
                 await asyncio.sleep(1)
 
-    async def _process_single_update(self, update: QuantityUpdate):
-        """Process single sheet update"""
+    async def _drain_forward_queue(self):
+        """Move sheet updates forwarded by other workers into the local queue"""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                updates = await loop.run_in_executor(None, self._get_forwarded_update)
+                if updates:
+                    self.update_queue.put_nowait(updates)
+                    SHEET_QUEUE_DEPTH.set(self.update_queue.qsize())
+            except Exception as e:
+                logging.error(f"Forward queue error: {e}")
+                await asyncio.sleep(1)
+
+    def _get_forwarded_update(self, timeout: float = 1) -> Optional[List[QuantityUpdate]]:
+        """Blocking read from the forward queue, returns None on timeout"""
         try:
-            logging.info(f"Processing update for product {update.product_id}: {update.new_quantity} in {update.sheet_name}")
-            if update.sheet_name not in self.product_sheets:
-                return
+            return self.forward_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
 
+    async def _process_batch(self, updates: List[QuantityUpdate]):
+        """Process a batch of sheet updates"""
+        try:
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
-                self._update_sheet_quantity,
-                update.sheet_name, update.sheet_row, update.new_quantity
-            )
+            await loop.run_in_executor(self.executor, self.write_quantities, updates)
         except Exception as e:
-            logging.error(f"Sheet update error for product {update.product_id}: {e}")
+            logging.error(f"Sheet update error for products {[update.product_id for update in updates]}: {e}")
 
-    def _update_sheet_quantity(self, sheet_name: str, row: int, quantity: int):
-        """Update quantity in sheet"""
-        logging.info(f"Updating {sheet_name} row {row} quantity to {quantity}")
-        worksheet = self.product_sheets[sheet_name]
-        self.retry_with_backoff(worksheet.update_cell, row, CONFIG.COL_QUANTITY + 1, quantity)
+    def get_quantity_data(self, updates: List[QuantityUpdate]) -> List[dict]:
+        """values_batch_update ranges for the quantities of known sheets"""
+        return [
+            {"range": build_a1_range(update.sheet_name, update.sheet_row, CONFIG.COL_QUANTITY + 1), "values": [[update.new_quantity]]}
+            for update in updates if update.sheet_name in self.product_sheets
+        ]
+
+    def write_quantities(self, updates: List[QuantityUpdate]):
+        """Write quantities of several products with a single batch request"""
+        data = self.get_quantity_data(updates)
+        if not data:
+            return
+
+        QUEUE_LOG.info("Updating quantities of %d rows in one batch", len(data))
+        self.retry_with_backoff(self.backend.values_batch_update, data)
 
     async def start_background_tasks(self, refresh_interval=15):
         """Start background tasks with initial delay"""
+        if not self.is_owner:
+            await self.wait_for_categories()
+            self.sync_task = asyncio.create_task(self._periodic_index_refresh(refresh_interval))
+            return
+
         self.queue_task = asyncio.create_task(self._process_update_queue())
         self.sync_task = asyncio.create_task(self._periodic_sync(refresh_interval))
+        if self.forward_queue is not None:
+            self.forward_task = asyncio.create_task(self._drain_forward_queue())
+
+    async def wait_for_categories(self, timeout: float = CATEGORIES_WAIT, interval: float = 1):
+        """Poll the saved categories until the owner has written them, workers starting with the owner may read none"""
+        loop = asyncio.get_event_loop()
+        deadline = time.monotonic() + timeout
+        while not CONFIG.PRODUCT_CATEGORIES and time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(self.executor, self.load_categories)
+
+        if not CONFIG.PRODUCT_CATEGORIES:
+            logging.warning(f"No categories saved by the sheet owner after {timeout}s, keyboards stay empty until the next refresh")
 
     async def stop_background_tasks(self):
         """Stop background tasks and cleanup"""
-        for task in [self.queue_task, self.sync_task]:
+        for task in [self.forward_task, self.queue_task, self.sync_task]:
             if task:
                 task.cancel()
                 try:
@@ -190,11 +292,38 @@ class SheetManager:
         await self.update_queue.join()
         self.executor.shutdown(wait=True)
 
+    async def _periodic_index_refresh(self, interval_seconds):
+        """Keep search index and categories fresh in workers that do not run the sync"""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await loop.run_in_executor(self.executor, self.load_categories)
+            await loop.run_in_executor(self.executor, self.rebuild_index)
+
     async def _periodic_sync(self, interval_seconds):
         """Periodic sync with initial delay"""
         while True:
             await asyncio.sleep(interval_seconds)
             try:
                 await self.sync_products()
+                if time.monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL:
+                    await self.take_stock_snapshots()
+                if time.monotonic() - self.last_quota_log >= QUOTA_LOG_INTERVAL:
+                    self.last_quota_log = time.monotonic()
+                    logging.info(self.tracer.get_summary())
             except Exception as e:
                 logging.error(f"Periodic sync error: {e}")
+
+    async def take_stock_snapshots(self):
+        """Snapshot ledger quantities so stock lookups only replay a short tail of movements"""
+        try:
+            loop = asyncio.get_event_loop()
+            count = await loop.run_in_executor(self.executor, self._take_snapshots)
+            self.last_snapshot = time.monotonic()
+            logging.info(f"Stock snapshots taken for {count} products")
+        except Exception as e:
+            logging.error(f"Error taking stock snapshots: {e}")
+
+    def _take_snapshots(self) -> int:
+        with self.session_factory() as session:
+            return StockRepository(session).take_snapshots()
@@ -0,0 +1,148 @@
+import gspread, json, random, threading, time
+from collections import Counter, deque
+from google.auth.exceptions import RefreshError
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from requests import Response
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.config import CONFIG, get_credentials
+
+def build_a1_range(title: str, row: int, col: int) -> str:
+    """A1 range of one cell, quotes inside the quoted sheet title are doubled: It's -> 'It''s'!C5"""
+    escaped = title.replace("'", "''")
+    return f"'{escaped}'!{rowcol_to_a1(row, col)}"
+
+def parse_a1_range(a1_range: str) -> Tuple[str, str]:
+    """'It''s'!C5 -> ("It's", "C5")"""
+    title, cell = a1_range.rsplit("!", 1)
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, cell
+
+class SheetsBackend:
+    """Spreadsheet operations SheetManager relies on, worksheets are addressed by title"""
+
+    def connect(self):
+        """(Re)open the spreadsheet, called on start and after auth or API errors"""
+        raise NotImplementedError
+
+    def get_titles(self) -> List[str]:
+        raise NotImplementedError
+
+    def row_values(self, title: str, row: int) -> List[str]:
+        raise NotImplementedError
+
+    def get_all_values(self, title: str) -> List[List[str]]:
+        raise NotImplementedError
+
+    def values_batch_update(self, data: List[Dict[str, Any]]):
+        """Write several A1 ranges like "'Sheet'!C5" with raw values in one request"""
+        raise NotImplementedError
+
+class GspreadBackend(SheetsBackend):
+    """Google Sheets through a gspread service account"""
+
+    def __init__(self, sheet_id: str = CONFIG.SHEET_ID):
+        self.sheet_id = sheet_id
+        self.spreadsheet = None
+        self.worksheets: Dict[str, gspread.Worksheet] = {}
+
+    def connect(self):
+        client = gspread.service_account_from_dict(info=get_credentials(), scopes=CONFIG.SCOPES)
+        self.spreadsheet = client.open_by_key(self.sheet_id)
+        self.worksheets = {worksheet.title: worksheet for worksheet in self.spreadsheet.worksheets()}
+
+    def get_titles(self) -> List[str]:
+        return list(self.worksheets)
+
+    def row_values(self, title: str, row: int) -> List[str]:
+        return self.worksheets[title].row_values(row)
+
+    def get_all_values(self, title: str) -> List[List[str]]:
+        return self.worksheets[title].get_all_values()
+
+    def values_batch_update(self, data: List[Dict[str, Any]]):
+        self.spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+
+def create_api_error(code: int, message: str) -> APIError:
+    """APIError as gspread raises it for an HTTP error response"""
+    response = Response()
+    response.status_code = code
+    response._content = json.dumps({"error": {"code": code, "message": message, "status": message}}).encode()
+    return APIError(response)
+
+ERRORS: Dict[str, Callable[[], Exception]] = {
+    "429": lambda: create_api_error(429, "RESOURCE_EXHAUSTED"),
+    "500": lambda: create_api_error(500, "INTERNAL"),
+    "auth": lambda: RefreshError("invalid_grant: simulated token expiry"),
+}
+
+class MemoryBackend(SheetsBackend):
+    """In-process spreadsheet with injectable latency, errors and concurrent edits for tests and benchmarks.
+
+    before_call(method, args) runs ahead of every call and may edit cells, calls are counted by (method, status)"""
+
+    def __init__(self, sheets: Optional[Dict[str, List[List[Any]]]] = None, latency: float = 0, error_rate: float = 0,
+                 seed: int = 0, before_call: Optional[Callable[[str, tuple], None]] = None):
+        self.sheets = {title: [[str(value) for value in row] for row in rows] for title, rows in (sheets or {}).items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.before_call = before_call
+        self.errors: Dict[str, Deque[str]] = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def inject_errors(self, method: str, *errors: str):
+        """Queue errors ("429", "500", "auth") raised by the next calls of a method"""
+        self.errors.setdefault(method, deque()).extend(errors)
+
+    def _call(self, method: str, *args):
+        if self.before_call:
+            self.before_call(method, args)
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            pending = self.errors.get(method)
+            error = pending.popleft() if pending else "429" if self.error_rate and self.rng.random() < self.error_rate else None
+            self.calls[method, error or "ok"] += 1
+        if error:
+            raise ERRORS[error]()
+
+    def get_call_count(self, method: str, status: str = "ok") -> int:
+        return self.calls[method, status]
+
+    def edit_cell(self, title: str, row: int, col: int, value: Any):
+        """Change a cell like a person editing the sheet would, rows and columns are 1-based"""
+        with self.lock:
+            rows = self.sheets[title]
+            while len(rows) < row:
+                rows.append([])
+            while len(rows[row - 1]) < col:
+                rows[row - 1].append("")
+            rows[row - 1][col - 1] = str(value)
+
+    def connect(self):
+        self._call("connect")
+
+    def get_titles(self) -> List[str]:
+        return list(self.sheets)
+
+    def row_values(self, title: str, row: int) -> List[str]:
+        self._call("row_values", title, row)
+        with self.lock:
+            rows = self.sheets[title]
+            return list(rows[row - 1]) if row <= len(rows) else []
+
+    def get_all_values(self, title: str) -> List[List[str]]:
+        self._call("get_all_values", title)
+        with self.lock:
+            return [list(row) for row in self.sheets[title]]
+
+    def values_batch_update(self, data: List[Dict[str, Any]]):
+        self._call("values_batch_update", data)
+        for update in data:
+            title, cell = parse_a1_range(update["range"])
+            self.edit_cell(title, *a1_to_rowcol(cell), update["values"][0][0])
@@ -0,0 +1,155 @@
+import logging, threading, time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from google.auth.exceptions import RefreshError
+from gspread.exceptions import APIError
+
+from repository.sheets_backend import SheetsBackend, parse_a1_range
+from utils.config import CONFIG
+from utils.metrics import SHEETS_CALLS, SHEETS_CALL_SECONDS
+
+QUOTA_WINDOW = 60
+QUOTA_WARN_SHARE = 0.8
+CALL_LOG = logging.getLogger("sheets.calls")
+# Sheets API requests behind each operation, every request costs one unit of the read or write per-minute quota
+QUOTA_UNITS: Dict[str, Tuple[str, int]] = {
+    "connect": ("read", 2),
+    "row_values": ("read", 1),
+    "get_all_values": ("read", 1),
+    "values_batch_update": ("write", 1),
+}
+
+@dataclass
+class SheetCall:
+    at: float
+    operation: str
+    sheet: str
+    size: int
+    seconds: float
+    attempt: int
+    status: str
+    kind: str
+    units: int
+
+class SheetsTracer:
+    """Keeps sheet calls of the last minute to estimate quota usage and feeds the Sheets call metrics"""
+
+    def __init__(self, window: float = QUOTA_WINDOW, read_quota: int = CONFIG.SHEETS_READ_QUOTA,
+                 write_quota: int = CONFIG.SHEETS_WRITE_QUOTA):
+        self.window = window
+        self.quotas = {"read": read_quota, "write": write_quota}
+        self.calls: Deque[SheetCall] = deque()
+        self.lock = threading.Lock()
+        self.warned_at = {"read": 0.0, "write": 0.0}
+
+    def record(self, call: SheetCall):
+        SHEETS_CALLS.inc(method=call.operation, status=call.status)
+        SHEETS_CALL_SECONDS.observe(call.seconds, method=call.operation)
+        if CALL_LOG.isEnabledFor(logging.DEBUG):
+            CALL_LOG.debug("Sheets call", extra={"op": call.operation, "sheet": call.sheet, "size": call.size, "ms": round(call.seconds * 1000, 1),
+                                                 "attempt": call.attempt, "status": call.status, "units": call.units})
+        with self.lock:
+            self.calls.append(call)
+            self._prune(call.at)
+            used = sum(item.units for item in self.calls if item.kind == call.kind)
+
+        quota = self.quotas[call.kind]
+        if used >= quota * QUOTA_WARN_SHARE and call.at - self.warned_at[call.kind] >= self.window:
+            self.warned_at[call.kind] = call.at
+            logging.warning("Sheets %s quota at %d/%d units per minute", call.kind, used, quota)
+
+    def _prune(self, now: float):
+        while self.calls and self.calls[0].at <= now - self.window:
+            self.calls.popleft()
+
+    def get_calls(self) -> List[SheetCall]:
+        with self.lock:
+            self._prune(time.time())
+            return list(self.calls)
+
+    def get_usage(self) -> Dict[str, Any]:
+        """Quota units, calls, errors, retries and latency per operation over the last minute"""
+        calls = self.get_calls()
+        units = Counter()
+        operations: Dict[str, Dict[str, float]] = {}
+        for call in calls:
+            units[call.kind] += call.units
+            stats = operations.setdefault(call.operation, {"calls": 0, "errors": 0, "retries": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["errors"] += call.status != "ok"
+            stats["retries"] += call.attempt > 0
+            stats["seconds"] += call.seconds
+            stats["max_seconds"] = max(stats["max_seconds"], call.seconds)
+
+        return {"units": {kind: (units[kind], quota) for kind, quota in self.quotas.items()}, "operations": operations}
+
+    def get_summary(self) -> str:
+        usage = self.get_usage()
+        units = " ".join(f"{kind}={used}/{quota}" for kind, (used, quota) in usage["units"].items())
+        operations = " ".join(f"{name}={int(stats['calls'])}" for name, stats in usage["operations"].items())
+        return f"Sheets quota last minute: {units} calls: {operations or 'none'}"
+
+def get_payload_size(operation: str, args: tuple, result: Any) -> int:
+    """Cells read or written by the call"""
+    if operation == "values_batch_update":
+        return sum(len(row) for update in args[0] for row in update["values"])
+    if operation == "get_all_values" and result:
+        return sum(len(row) for row in result)
+    if operation == "row_values" and result:
+        return len(result)
+    return 0
+
+def get_sheet_name(operation: str, args: tuple) -> str:
+    if operation == "values_batch_update":
+        return ",".join(sorted({parse_a1_range(update["range"])[0] for update in args[0]}))
+    return args[0] if args else ""
+
+class TracedBackend(SheetsBackend):
+    """Backend wrapper recording every call into a SheetsTracer"""
+
+    def __init__(self, backend: SheetsBackend, tracer: Optional[SheetsTracer] = None):
+        self.backend = backend
+        self.tracer = tracer or SheetsTracer()
+        self.local = threading.local()
+
+    @contextmanager
+    def attempt(self, attempt: int):
+        """Mark calls made inside as the given retry attempt, 0 is the first try"""
+        previous = getattr(self.local, "attempt", 0)
+        self.local.attempt = attempt
+        try:
+            yield
+        finally:
+            self.local.attempt = previous
+
+    def _trace(self, operation: str, *args) -> Any:
+        kind, units = QUOTA_UNITS[operation]
+        at, start = time.time(), time.perf_counter()
+        status, result = "ok", None
+        try:
+            result = getattr(self.backend, operation)(*args)
+            return result
+        except Exception as e:
+            status = str(e.code) if isinstance(e, APIError) else "auth" if isinstance(e, RefreshError) else "error"
+            raise
+        finally:
+            self.tracer.record(SheetCall(at, operation, get_sheet_name(operation, args), get_payload_size(operation, args, result),
+                                         time.perf_counter() - start, getattr(self.local, "attempt", 0), status, kind, units))
+
+    def connect(self):
+        self._trace("connect")
+
+    def get_titles(self) -> List[str]:
+        return self.backend.get_titles()
+
+    def row_values(self, title: str, row: int) -> List[str]:
+        return self._trace("row_values", title, row)
+
+    def get_all_values(self, title: str) -> List[List[str]]:
+        return self._trace("get_all_values", title)
+
+    def values_batch_update(self, data: List[Dict[str, Any]]):
+        return self._trace("values_batch_update", data)
@@ -0,0 +1,122 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+
+from database.models import Product, StockMovement, StockSnapshot, MovementReason
+
+SOURCE_BOT = "bot"
+SOURCE_SHEET = "sheet"
+SOURCE_MAINTENANCE = "maintenance"
+
+class StockRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def add_movement(self, product_id: int, delta: int, reason: MovementReason, source: str,
+                     order_id: str = None) -> Optional[StockMovement]:
+        """Add movement to the session, it is committed together with the quantity change it describes"""
+        if not delta:
+            return None
+
+        movement = StockMovement(product_id=product_id, delta=delta, reason=reason, source=source, order_id=order_id)
+        self.session.add(movement)
+        return movement
+
+    def get_movements(self, product_id: int, limit: int = 20) -> List[StockMovement]:
+        """Get latest movements of a product"""
+        return self.session.query(StockMovement).filter(
+            StockMovement.product_id == product_id
+        ).order_by(StockMovement.id.desc()).limit(limit).all()
+
+    def record_baseline(self, source: str = SOURCE_MAINTENANCE) -> int:
+        """Open the ledger with current quantities of products that have no movements yet"""
+        has_movements = self.session.query(StockMovement.product_id).distinct()
+        products = self.session.query(Product).filter(Product.id.notin_(has_movements)).all()
+
+        for product in products:
+            self.add_movement(product.id, product.quantity or 0, MovementReason.INITIAL, source)
+        self.session.commit()
+        return len(products)
+
+    def _get_latest_snapshots(self, at: datetime = None):
+        """Subquery with the latest snapshot per product, optionally taken no later than `at`"""
+        query = self.session.query(func.max(StockSnapshot.id).label("id"))
+        if at:
+            query = query.filter(StockSnapshot.created_at <= at)
+
+        latest = query.group_by(StockSnapshot.product_id).subquery()
+        return self.session.query(StockSnapshot).join(latest, latest.c.id == StockSnapshot.id).subquery()
+
+    def get_quantities(self, at: datetime = None, last_movement_id: int = None) -> Dict[int, int]:
+        """Get ledger quantity of every product now or at a point in time"""
+        snapshots = self._get_latest_snapshots(at)
+
+        query = self.session.query(StockMovement.product_id, func.sum(StockMovement.delta)).outerjoin(
+            snapshots, snapshots.c.product_id == StockMovement.product_id
+        ).filter(StockMovement.id > func.coalesce(snapshots.c.movement_id, 0))
+        if at:
+            query = query.filter(StockMovement.created_at <= at)
+        if last_movement_id:
+            query = query.filter(StockMovement.id <= last_movement_id)
+
+        quantities = {product_id: quantity for product_id, quantity in self.session.query(snapshots.c.product_id, snapshots.c.quantity)}
+        for product_id, tail in query.group_by(StockMovement.product_id):
+            quantities[product_id] = quantities.get(product_id, 0) + tail
+        return quantities
+
+    def get_quantity(self, product_id: int, at: datetime = None) -> int:
+        """Get ledger quantity of a product from its latest snapshot plus the movements after it"""
+        query = self.session.query(StockSnapshot).filter(StockSnapshot.product_id == product_id)
+        if at:
+            query = query.filter(StockSnapshot.created_at <= at)
+        snapshot = query.order_by(StockSnapshot.id.desc()).first()
+
+        tail = self.session.query(func.coalesce(func.sum(StockMovement.delta), 0)).filter(
+            StockMovement.product_id == product_id,
+            StockMovement.id > (snapshot.movement_id if snapshot else 0)
+        )
+        if at:
+            tail = tail.filter(StockMovement.created_at <= at)
+
+        return (snapshot.quantity if snapshot else 0) + tail.scalar()
+
+    def take_snapshots(self) -> int:
+        """Snapshot every product that moved since its last snapshot, returns number of snapshots"""
+        # Movement ids are taken before commit, so without the lock an earlier id could commit after the snapshot and
+        # stay below its watermark for good. SHARE mode waits for open movement writes and holds new ones until the
+        # snapshot commits, SQLite already runs one writer at a time
+        if self.session.get_bind().dialect.name == "postgresql":
+            self.session.execute(text("LOCK TABLE stock_movements IN SHARE MODE"))
+
+        last_movement_id = self.session.query(func.max(StockMovement.id)).scalar()
+        if not last_movement_id:
+            self.session.commit()
+            return 0
+
+        snapshots = self._get_latest_snapshots()
+        moved = self.session.query(StockMovement.product_id).outerjoin(
+            snapshots, snapshots.c.product_id == StockMovement.product_id
+        ).filter(
+            StockMovement.id > func.coalesce(snapshots.c.movement_id, 0),
+            StockMovement.id <= last_movement_id
+        ).distinct()
+        moved_ids = {product_id for product_id, in moved}
+        if not moved_ids:
+            self.session.commit()
+            return 0
+
+        quantities = self.get_quantities(last_movement_id=last_movement_id)
+        for product_id in moved_ids:
+            self.session.add(StockSnapshot(product_id=product_id, quantity=quantities[product_id], movement_id=last_movement_id))
+        self.session.commit()
+        return len(moved_ids)
+
+    def find_drift(self) -> List[Tuple[Product, int]]:
+        """Get (product, ledger quantity) for products whose stored quantity disagrees with the ledger"""
+        quantities = self.get_quantities()
+        return [
+            (product, quantities.get(product.id, 0))
+            for product in self.session.query(Product).order_by(Product.id)
+            if (product.quantity or 0) != quantities.get(product.id, 0)
+        ]
@@ -0,0 +1,196 @@
+import asyncio, itertools, logging, time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, EditMessageText, EditMessageReplyMarkup, DeleteMessage, SendMessage, SendDocument
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message
+
+from utils.metrics import SEND_WAIT_SECONDS
+
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_RETRIES = 3
+EDIT_CACHE_SIZE = 1000
+SLOW_WAIT_SECONDS = 1
+
+PRIORITY_EDIT, PRIORITY_MESSAGE, PRIORITY_DOCUMENT = 0, 1, 2
+
+METHOD_PRIORITIES = {
+    EditMessageText: PRIORITY_EDIT,
+    EditMessageReplyMarkup: PRIORITY_EDIT,
+    DeleteMessage: PRIORITY_MESSAGE,
+    SendMessage: PRIORITY_MESSAGE,
+    SendDocument: PRIORITY_DOCUMENT
+}
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Drain the bucket so the next token appears in `seconds`"""
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+class SendScheduler(BaseRequestMiddleware):
+    """Rate-limits outgoing chat methods with a priority queue and skips no-op edits"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+
+        self.waiters: List[Tuple[int, int, Any, float, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.pump_task = None
+
+        self.sent_messages: OrderedDict[Tuple[Any, int], Tuple[str, Optional[str], Message]] = OrderedDict()
+        self.skipped_edits = 0
+        self.wait_stats = {priority: {"count": 0, "total": 0.0, "max": 0.0} for priority in set(METHOD_PRIORITIES.values())}
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> TelegramType:
+        priority = METHOD_PRIORITIES.get(type(method))
+        if priority is None:
+            return await make_request(bot, method)
+
+        if isinstance(method, EditMessageText):
+            cached = self._get_unchanged_message(method)
+            if cached:
+                self.skipped_edits += 1
+                return cached
+
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logging.warning(f"Flood limit hit for chat {chat_id}, retrying in {e.retry_after}s")
+                self._get_chat_bucket(chat_id).pause(e.retry_after)
+                if chat_id is None:
+                    self.global_bucket.pause(e.retry_after)
+                continue
+
+            self._remember(method, result)
+            return result
+
+    def get_wait_stats(self) -> Dict[int, Dict[str, float]]:
+        """Queue wait times per priority (count, avg and max in seconds)"""
+        return {
+            priority: {"count": s["count"], "avg": s["total"] / s["count"] if s["count"] else 0.0, "max": s["max"]}
+            for priority, s in self.wait_stats.items()
+        }
+
+    def _get_chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if not bucket:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _acquire(self, chat_id: Any, priority: int):
+        """Wait until the pump grants a send slot for this chat"""
+        if not self.pump_task or self.pump_task.done():
+            self.pump_task = asyncio.create_task(self._pump())
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((priority, next(self.sequence), chat_id, time.monotonic(), future))
+        self.wakeup.set()
+        await future
+
+    async def _pump(self):
+        """Grant slots to waiters in priority order as the rate limits allow"""
+        while True:
+            self.waiters = [waiter for waiter in self.waiters if not waiter[4].done()]
+            if not self.waiters:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = self.global_bucket.delay(now)
+            if not delay:
+                ready = [waiter for waiter in self.waiters if not self._get_chat_bucket(waiter[2]).delay(now)]
+                if ready:
+                    self._grant(min(ready), now)
+                    continue
+                delay = min(self._get_chat_bucket(waiter[2]).delay(now) for waiter in self.waiters)
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self, waiter: Tuple[int, int, Any, float, asyncio.Future], now: float):
+        priority, _, chat_id, queued_at, future = waiter
+        self.waiters.remove(waiter)
+        self.global_bucket.take()
+        self._get_chat_bucket(chat_id).take()
+
+        wait = now - queued_at
+        stats = self.wait_stats[priority]
+        stats["count"] += 1
+        stats["total"] += wait
+        stats["max"] = max(stats["max"], wait)
+        SEND_WAIT_SECONDS.observe(wait, priority=priority)
+        if wait > SLOW_WAIT_SECONDS:
+            logging.warning(f"Send queue wait {wait:.2f}s for chat {chat_id} (priority {priority})")
+
+        future.set_result(None)
+
+    @staticmethod
+    def _markup_key(markup: Any) -> Optional[str]:
+        return markup.model_dump_json() if markup else None
+
+    def _get_unchanged_message(self, method: EditMessageText) -> Optional[Message]:
+        """Return last known message if the edit would not change its text and markup"""
+        cached = self.sent_messages.get((method.chat_id, method.message_id))
+        if not cached:
+            return None
+
+        text, markup, message = cached
+        if text == method.text and markup == self._markup_key(method.reply_markup):
+            return message
+        return None
+
+    def _remember(self, method: TelegramMethod, result: Any):
+        """Track text and markup of messages we sent or edited"""
+        if isinstance(method, DeleteMessage):
+            self.sent_messages.pop((method.chat_id, method.message_id), None)
+            return
+
+        if not isinstance(result, Message):
+            return
+
+        key = (result.chat.id, result.message_id)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            self.sent_messages[key] = (method.text, self._markup_key(method.reply_markup), result)
+        elif isinstance(method, EditMessageReplyMarkup) and key in self.sent_messages:
+            text, _, _ = self.sent_messages[key]
+            self.sent_messages[key] = (text, self._markup_key(method.reply_markup), result)
+        else:
+            return
+
+        self.sent_messages.move_to_end(key)
+        while len(self.sent_messages) > EDIT_CACHE_SIZE:
+            self.sent_messages.popitem(last=False)
@@ -1,8 +1,9 @@
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict, Tuple, Iterator
 from datetime import datetime, date, timedelta
 
-from database.models import Order, OrderItem, Product, ProfitAdjustment
-from repository.order_repository import OrderRepository
+from database.models import Order, OrderItem, OrderStatus, Product, ProfitAdjustment, MovementReason
+from database.read_models import OrderView
+from repository.order_repository import OrderRepository, OrderPage
 from service.product_service import ProductService
 from utils.shit_utils import get_date_range, format_customer_message, build_date_period, format_dates_with_orders
 from utils.config import CONFIG
@@ -15,8 +16,8 @@ class OrderService:
     def create_order(self) -> Order:
         return self.order_repo.create_order()
 
-    def get_active_order_names(self) -> List[Tuple[str, str]]:
-        return self.order_repo.get_active_order_names()
+    def get_active_orders_page(self, cursor: Optional[str] = None, backward: bool = False) -> OrderPage:
+        return self.order_repo.get_active_orders_page(cursor, backward)
 
     def get_dates_with_completed_orders(self, days_limit: int = 3) -> List[Tuple[date, str]]:
         completed_dates = sorted(self.order_repo.get_completed_dates(days_limit))
@@ -24,12 +25,18 @@ class OrderService:
             return format_dates_with_orders(sorted(completed_dates, reverse=True))
         return []
 
-    def get_completed_orders_display_names_by_date(self, date_value: date) -> List[Tuple[str, str]]:
-        return self.order_repo.get_completed_order_names_by_date(date_value)
+    def get_completed_orders_page_by_date(self, date_value: date, cursor: Optional[str] = None, backward: bool = False) -> OrderPage:
+        return self.order_repo.get_completed_orders_page_by_date(date_value, cursor, backward)
+
+    def search_orders(self, text: str, cursor: Optional[str] = None, backward: bool = False) -> OrderPage:
+        return self.order_repo.search_orders(text, cursor, backward)
 
     def get_order(self, order_id: str) -> Optional[Order]:
         return self.order_repo.get_by_id(order_id)
 
+    def get_order_view(self, order_id: str) -> Optional[OrderView]:
+        return self.order_repo.get_order_view(order_id)
+
     def get_active_order_names_list(self) -> List[str]:
         return self.order_repo.get_active_order_names_list()
 
@@ -40,17 +47,12 @@ class OrderService:
         return self.order_repo.update_order_name(order, name)
 
     def add_product_to_order(self, order: Order, product: Product, quantity: int) -> None:
-        self.product_service.remove_quantity(product, quantity)
         self.order_repo.add_item(order, product.id, quantity, product.price, product.cost, product.full_name)
 
     def update_order_item_quantity(self, item: OrderItem, new_quantity: int) -> None:
-        product = self.product_service.get_product_by_id(item.product_id)
-        self.product_service.update_quantity(product, product.quantity - (new_quantity - item.quantity))
         self.order_repo.update_item_quantity(item, new_quantity)
 
     def remove_order_item(self, item: OrderItem) -> None:
-        product = self.product_service.get_product_by_id(item.product_id)
-        self.product_service.add_quantity(product, item.quantity)
         self.order_repo.remove_item(item)
 
     def replace_order_item(self, item: OrderItem, quantity: int) -> None:
@@ -65,27 +67,70 @@ class OrderService:
             profit_amount=-total_price
         )
 
-    def complete_order(self, order: Order, completion_date: datetime = None) -> Tuple[bool, str]:
+    @staticmethod
+    def _validate_completion(order: Order, completion_date: Optional[datetime]) -> Optional[str]:
+        """Reason why the order can not be completed on that date, None if it can"""
+        if order.status != OrderStatus.PENDING:
+            return "Заказ уже завершен"
+
         if not order.items:
-            return False, "Невозможно завершить пустой заказ"
+            return "Невозможно завершить пустой заказ"
 
         if completion_date and completion_date.date() < order.created_at.date():
-            return False, "Дата завершения не может быть раньше даты создания заказа"
+            return "Дата завершения не может быть раньше даты создания заказа"
+
+        return None
 
-        self.order_repo.complete_order(order, completion_date)
+    def complete_order(self, order: Order, completion_date: datetime = None) -> Tuple[bool, str]:
+        error = self._validate_completion(order, completion_date)
+        if error:
+            return False, error
+
+        # The status change commits together with the stock ledger, another worker may have completed the order meanwhile
+        if not self.order_repo.complete_order(order, completion_date, commit=False):
+            return False, "Заказ уже завершен"
+        self.product_service.apply_stock_changes(self.get_stock_deltas(order, -1), MovementReason.SALE, order.id)
         return True, f"✅ Заказ {order.display_name} успешно завершен!"
 
+    def complete_orders(self, order_ids: List[str], completion_date: datetime = None) -> Tuple[List[Order], List[Tuple[Order, str]]]:
+        """Complete all valid orders in one transaction, returns completed orders and (order, reason) of skipped ones"""
+        completed, skipped = [], []
+        for order in self.order_repo.get_by_ids(order_ids):
+            error = self._validate_completion(order, completion_date)
+            if error:
+                skipped.append((order, error))
+            else:
+                completed.append(order)
+
+        if not completed:
+            return completed, skipped
+
+        flipped = set(self.order_repo.complete_orders([order.id for order in completed], completion_date, commit=False))
+        skipped += [(order, "Заказ уже завершен") for order in completed if order.id not in flipped]
+        completed = [order for order in completed if order.id in flipped]
+
+        # The ledger commit also commits the status change
+        stock_deltas = {order.id: self.get_stock_deltas(order, -1) for order in completed}
+        self.product_service.apply_order_stock_changes(stock_deltas, MovementReason.SALE)
+        return completed, skipped
+
+    def get_batch_completion_date_options(self, order_ids: List[str]) -> List[Tuple[date, str]]:
+        """Completion dates valid for at least one of the orders"""
+        orders = self.order_repo.get_by_ids(order_ids)
+        return get_date_range(min(orders, key=lambda order: order.created_at)) if orders else []
+
     def restore_order(self, order: Order) -> str:
-        self.order_repo.restore_order(order)
+        self.order_repo.restore_order(order, commit=False)
+        self.product_service.apply_stock_changes(self.get_stock_deltas(order, 1), MovementReason.RETURN, order.id)
         return f"✅ Заказ {order.display_name} успешно активирован!"
 
     def delete_order(self, order: Order) -> str:
-        for item in order.items:
-            product = self.product_service.get_product_by_id(item.product_id)
-            if product:
-                self.product_service.add_quantity(product, item.quantity)
+        # Pending orders only hold reservations, stock left the shelf only for completed ones
+        deltas = self.get_stock_deltas(order, 1) if order.status == OrderStatus.COMPLETED else {}
 
-        self.order_repo.delete_order(order)
+        order_id = order.id
+        self.order_repo.delete_order(order, commit=False)
+        self.product_service.apply_stock_changes(deltas, MovementReason.RETURN, order_id)
         return f"🗑️ Заказ {order.display_name} успешно удален!"
 
     def get_available_months(self) -> List[Tuple[int, int, str]]:
@@ -102,23 +147,28 @@ class OrderService:
 
         return start_date, end_date, f"{CONFIG.STATS_MONTHS[month]} {year}"
 
-    def get_statistics(self, start_date: datetime, end_date: datetime) -> Dict:
-        orders = self.order_repo.get_completed_orders_by_period(start_date, end_date)
+    def get_sales_analytics(self, start_date: datetime, end_date: datetime) -> Dict:
+        products, categories = [], {}
+
+        for category, product_name, units, revenue, cost in self.order_repo.get_product_sales(start_date, end_date):
+            category = category or "Без категории"
+            products.append({"category": category, "name": product_name, "units": units,
+                             "revenue": revenue, "cost": cost, "margin": revenue - cost})
 
-        total_sum = sum(order.total for order in orders)
-        total_cost = sum(order.total_cost for order in orders)
-        total_adjustments = sum(order.total_adjustments for order in orders)
-        profit = sum(order.profit for order in orders)
+            totals = categories.setdefault(category, {"name": category, "units": 0, "revenue": 0, "cost": 0, "margin": 0})
+            totals["units"] += units
+            totals["revenue"] += revenue
+            totals["cost"] += cost
+            totals["margin"] += revenue - cost
 
         return {
-            "orders": orders,
-            "count": len(orders),
-            "total_sum": total_sum,
-            "total_cost": total_cost,
-            "total_adjustments": total_adjustments,
-            "net_profit": profit
+            "products": products,
+            "categories": sorted(categories.values(), key=lambda c: c["revenue"], reverse=True)
         }
 
+    def iter_completed_orders(self, start_date: datetime, end_date: datetime) -> Iterator[OrderView]:
+        return self.order_repo.iter_completed_orders_by_period(start_date, end_date)
+
     def add_profit_adjustment(self, order: Order, amount: float, reason: str, affects_total: bool = True, profit_amount: float = None) -> None:
         self.order_repo.add_profit_adjustment(order, amount, reason, affects_total, profit_amount)
 
@@ -128,6 +178,17 @@ class OrderService:
     def delete_profit_adjustment(self, adjustment_id: int) -> None:
         self.order_repo.delete_profit_adjustment(adjustment_id)
 
+    @staticmethod
+    def get_stock_deltas(order: Order, sign: int) -> Dict[int, int]:
+        """On-hand stock change per product when order items leave (-1) or return to (1) the shelf,
+        items of deleted products have no stock to change"""
+        deltas = {}
+        for item in order.items:
+            if item.product_id is None:
+                continue
+            deltas[item.product_id] = deltas.get(item.product_id, 0) + sign * item.quantity
+        return deltas
+
     @staticmethod
     def get_completion_date_options(order: Order) -> List[Tuple[date, str]]:
         return get_date_range(order)
@@ -1,7 +1,14 @@
-from typing import List, Optional
-from database.models import Product
+import csv
+from typing import Dict, List, Optional, Tuple
+from database.models import Product, MovementReason
 from repository.product_repository import ProductRepository
 from repository.sheets import SheetManager
+from repository.product_index import IndexedProduct
+
+STOCK_INTAKE_MAX_LINES = 1000
+
+def get_catalog_key(category: str, name: str, attribute: str) -> Tuple[str, str, str]:
+    return category.strip().lower(), name.strip().lower(), attribute.strip().lower()
 
 class ProductService:
     def __init__(self, product_repo: ProductRepository, sheet_manager: SheetManager):
@@ -20,14 +27,85 @@ class ProductService:
     def get_product(self, category: str, product_name: str, attribute: str) -> Optional[Product]:
         return self.product_repo.get_by_name_attribute(category, product_name, attribute)
 
+    def search_products(self, query: str, limit: int = 20) -> List[IndexedProduct]:
+        return self.sheet_manager.product_index.search(query, limit)
+
     def get_product_by_id(self, product_id: int) -> Optional[Product]:
         return self.product_repo.get_by_id(product_id)
 
+    def get_available_quantity(self, product: Product) -> int:
+        """On-hand quantity minus what pending orders reserve"""
+        return product.quantity - self.product_repo.get_reserved_quantity(product.id)
+
+    def apply_stock_changes(self, deltas: Dict[int, int], reason: MovementReason, order_id: str = None) -> bool:
+        """Shift on-hand stock of several products and write them to the sheet in one batch"""
+        return self.apply_order_stock_changes({order_id: deltas}, reason)
+
+    def apply_order_stock_changes(self, order_deltas: Dict[Optional[str], Dict[int, int]], reason: MovementReason) -> bool:
+        """Shift on-hand stock for several orders at once and write the sheet in one batch.
+
+        Commits even without deltas, so order changes the caller left uncommitted land with the ledger"""
+        order_deltas = {
+            order_id: {product_id: delta for product_id, delta in deltas.items() if delta}
+            for order_id, deltas in order_deltas.items()
+        }
+        products = self.product_repo.adjust_order_quantities(order_deltas, reason)
+        return self.sheet_manager.queue_quantity_updates(products) if products else True
+
     def add_quantity(self, product: Product, amount: int) -> bool:
-        return self.sheet_manager.queue_quantity_update(product, product.quantity + amount)
+        return self.apply_stock_changes({product.id: amount}, MovementReason.MANUAL)
 
     def remove_quantity(self, product: Product, amount: int) -> bool:
-        return self.sheet_manager.queue_quantity_update(product, product.quantity - amount)
+        return self.apply_stock_changes({product.id: -amount}, MovementReason.MANUAL)
 
     def update_quantity(self, product: Product, new_quantity: int) -> bool:
-        return self.sheet_manager.queue_quantity_update(product, new_quantity)
+        return self.apply_stock_changes({product.id: new_quantity - product.quantity}, MovementReason.MANUAL)
+
+    def apply_stock_intake(self, text: str) -> List[Tuple[int, bool, str]]:
+        """Apply `category;name;attribute;delta` lines in one transaction, returns (line number, ok, message) per line"""
+        catalog = {get_catalog_key(p.sheet_name, p.name, p.attribute): p for p in self.product_repo.get_all_active()}
+        parsed, results = [], []
+
+        for line_no, row in enumerate(csv.reader(text.splitlines(), delimiter=";"), start=1):
+            if not row or not "".join(row).strip() or row[0].startswith("#"):
+                continue
+            if len(parsed) + len(results) >= STOCK_INTAKE_MAX_LINES:
+                results.append((line_no, False, f"превышен лимит в {STOCK_INTAKE_MAX_LINES} строк, остаток файла пропущен"))
+                break
+            if len(row) != 4:
+                results.append((line_no, False, "ожидается 4 поля: категория;товар;атрибут;количество"))
+                continue
+
+            product = catalog.get(get_catalog_key(*row[:3]))
+            if not product:
+                results.append((line_no, False, f"товар {row[1].strip()} ({row[2].strip()}) не найден в категории {row[0].strip()}"))
+                continue
+
+            try:
+                delta = int(row[3].strip())
+            except ValueError:
+                results.append((line_no, False, f"некорректное количество \"{row[3].strip()}\""))
+                continue
+
+            if not delta:
+                results.append((line_no, False, "количество не может быть 0"))
+                continue
+            parsed.append((line_no, product, delta))
+
+        # Write-offs may not eat into stock held by pending orders, same as get_available_quantity
+        reserved = self.product_repo.get_reserved_quantities() if any(delta < 0 for _, _, delta in parsed) else {}
+        deltas = {}
+        for line_no, product, delta in parsed:
+            on_hand, held = (product.quantity or 0) + deltas.get(product.id, 0), reserved.get(product.id, 0)
+            if delta < 0 and on_hand - held + delta < 0:
+                results.append((line_no, False, f"{product.full_name}: доступно только {max(on_hand - held, 0)} шт. "
+                                                f"(на складе {on_hand}, в резерве {held})"))
+                continue
+
+            new_quantity = on_hand + delta
+
+            deltas[product.id] = deltas.get(product.id, 0) + delta
+            results.append((line_no, True, f"{product.full_name}: {delta:+d} → {new_quantity}"))
+
+        self.apply_stock_changes(deltas, MovementReason.MANUAL)
+        return sorted(results)
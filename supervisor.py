@@ -0,0 +1,140 @@
+import asyncio, logging, multiprocessing
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.types import Update
+from typing import Dict, List
+
+from database.session import init_db, session_factory
+from repository.sheets import SheetManager
+from send_scheduler import GLOBAL_RATE
+from utils.config import CONFIG
+from utils.metrics import start_metrics_server
+from utils.loop_monitor import LoopMonitor
+from utils.update_log import get_worker_log_path
+from utils.logging_setup import setup_logging
+from bot import build_bot, build_dispatcher
+
+SHEET_OWNER_INDEX = 0
+POLL_TIMEOUT = 30
+
+def get_shard(update: Update, workers: int) -> int:
+    """Pick worker for an update so all updates of one user land in the same process"""
+    user = getattr(update.event, "from_user", None)
+    key = user.id if user else update.update_id
+    return key % workers
+
+def run_worker(index: int, workers: int, updates: multiprocessing.Queue, sheet_updates: multiprocessing.Queue):
+    """Worker process entry point"""
+    setup_logging(worker=index)
+    try:
+        asyncio.run(worker_main(index, workers, updates, sheet_updates))
+    except Exception as e:
+        logging.error(f"Worker {index} crashed: {e}", exc_info=True)
+
+async def worker_main(index: int, workers: int, updates: multiprocessing.Queue, sheet_updates: multiprocessing.Queue):
+    """Feed updates routed to this worker into its own dispatcher"""
+    bot = build_bot(send_rate=GLOBAL_RATE / workers)
+    sheet_manager = SheetManager(session_factory, is_owner=index == SHEET_OWNER_INDEX, forward_queue=sheet_updates)
+    dp = build_dispatcher(sheet_manager, record_path=get_worker_log_path(CONFIG.RECORD_UPDATES, index) if CONFIG.RECORD_UPDATES else "")
+
+    await sheet_manager.start_background_tasks()
+    # Every worker has its own registry, so each one serves metrics on its own port
+    metrics_runner = await start_metrics_server(CONFIG.METRICS_PORT + index) if CONFIG.METRICS_PORT else None
+    loop_monitor = LoopMonitor(threshold=CONFIG.LOOP_STALL_MS / 1000)
+    loop_monitor.start()
+
+    loop = asyncio.get_running_loop()
+    user_locks: Dict[int, asyncio.Lock] = {}
+    user_waiters: Dict[int, int] = {}
+    tasks = set()
+
+    try:
+        logging.info(f"Worker {index} started (sheet owner: {sheet_manager.is_owner})")
+        while True:
+            raw_update = await loop.run_in_executor(None, updates.get)
+            if raw_update is None:
+                break
+
+            update = Update.model_validate_json(raw_update, context={"bot": bot})
+            user = getattr(update.event, "from_user", None)
+            task = asyncio.create_task(process_update(dp, bot, update, user.id if user else 0, user_locks, user_waiters))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await dp.emit_shutdown()
+        await loop_monitor.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await sheet_manager.stop_background_tasks()
+        await bot.session.close()
+
+async def process_update(dp: Dispatcher, bot: Bot, update: Update, user_id: int, user_locks: Dict[int, asyncio.Lock],
+                         user_waiters: Dict[int, int]):
+    """Process update while holding its user lock so per-user order is kept, the lock is dropped with its last waiter"""
+    lock = user_locks.setdefault(user_id, asyncio.Lock())
+    user_waiters[user_id] = user_waiters.get(user_id, 0) + 1
+
+    try:
+        async with lock:
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                logging.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+    finally:
+        user_waiters[user_id] -= 1
+        if not user_waiters[user_id]:
+            del user_waiters[user_id], user_locks[user_id]
+
+def start_worker(ctx, index: int, workers: int, updates: multiprocessing.Queue, sheet_updates: multiprocessing.Queue) -> multiprocessing.Process:
+    process = ctx.Process(target=run_worker, args=(index, workers, updates, sheet_updates), name=f"worker-{index}", daemon=True)
+    process.start()
+    return process
+
+async def poll_updates(bot: Bot, ctx, processes: List[multiprocessing.Process],
+                       update_queues: List[multiprocessing.Queue], sheet_updates: multiprocessing.Queue):
+    """Long-poll Telegram and route every update to its worker"""
+    offset = None
+    while True:
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                logging.warning(f"Worker {index} is dead (exit code {process.exitcode}), restarting")
+                processes[index] = start_worker(ctx, index, len(processes), update_queues[index], sheet_updates)
+
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+        except TelegramNetworkError as e:
+            logging.warning(f"Polling error: {e}")
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            shard = get_shard(update, len(update_queues))
+            update_queues[shard].put(update.model_dump_json(by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+async def supervisor_main(workers: int):
+    init_db()
+
+    bot = build_bot()
+    await bot.delete_webhook(drop_pending_updates=True)
+
+    ctx = multiprocessing.get_context("spawn")
+    update_queues = [ctx.Queue() for _ in range(workers)]
+    sheet_updates = ctx.Queue()
+    processes = [start_worker(ctx, i, workers, update_queues[i], sheet_updates) for i in range(workers)]
+
+    try:
+        logging.info(f"Supervisor starting {workers} workers...")
+        await poll_updates(bot, ctx, processes, update_queues, sheet_updates)
+    finally:
+        for update_queue in update_queues:
+            update_queue.put(None)
+        for process in processes:
+            process.join(timeout=30)
+        await bot.session.close()
+
+def run_supervisor(workers: int):
+    asyncio.run(supervisor_main(workers))
@@ -6,6 +6,9 @@ from dataclasses import dataclass, field
 load_dotenv()
 
 def get_db_url():
+    if os.getenv("DB_URL"):
+        return os.getenv("DB_URL")
+
     user: str = str(os.getenv("DB_USER", "postgres"))
     password: str = str(os.getenv("DB_PASSWORD", ""))
 
@@ -36,6 +39,16 @@ class Config:
     SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
     CREDENTIALS_FILE = "repository/credentials.json"
     EXCLUDED_SHEET = "Товарка"
+    WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+    STATS_REPORT_GZIP = os.getenv("STATS_REPORT_GZIP", "0") == "1"
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+    LOOP_STALL_MS = int(os.getenv("LOOP_STALL_MS", "500"))
+    RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")
+    SHEETS_READ_QUOTA = int(os.getenv("SHEETS_READ_QUOTA", "60"))
+    SHEETS_WRITE_QUOTA = int(os.getenv("SHEETS_WRITE_QUOTA", "60"))
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_SAMPLE = os.getenv("LOG_SAMPLE", "sheets.queue=10,aiogram.event=10")
 
     COL_PRODUCT = 0
     COL_ATTRIBUTE = 1
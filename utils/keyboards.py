@@ -1,9 +1,13 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from typing import List, Tuple, Optional
 from datetime import date
+import math
 
 from utils.config import CONFIG
 from utils.shit_utils import format_price
+from repository.order_repository import OrderPage
+
+CATALOG_PAGE_SIZE = 24
 
 def format_inline_kb(buttons: list[InlineKeyboardButton], max_in_row: int = 2) -> list[list[InlineKeyboardButton]]:
     return [buttons[i:min(i + max_in_row, len(buttons))] for i in range(0, len(buttons), max_in_row)]
@@ -28,28 +32,70 @@ def get_orders_menu() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True,
         keyboard=[
             [KeyboardButton(text="➕ Новый заказ"), KeyboardButton(text="✅ Завершить заказ"), KeyboardButton(text="🗑️ Удалить заказ")],
-            [KeyboardButton(text="📝 Активные заказы"), KeyboardButton(text="🔄 Восстановить заказ")],
-            [KeyboardButton(text="💬 Сообщение клиенту"), KeyboardButton(text="🔙 Назад")]
+            [KeyboardButton(text="📝 Активные заказы"), KeyboardButton(text="🔄 Восстановить заказ"), KeyboardButton(text="🔍 Найти заказ")],
+            [KeyboardButton(text="💬 Сообщение клиенту"), KeyboardButton(text="☑️ Завершить несколько"), KeyboardButton(text="🔙 Назад")]
         ]
     )
 
 def get_products_menu() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True,
         keyboard=[
-            [KeyboardButton(text="➕ Добавить количество"), KeyboardButton(text="➖ Убрать количество"), KeyboardButton(text="🔙 Назад")]
+            [KeyboardButton(text="➕ Добавить количество"), KeyboardButton(text="➖ Убрать количество")],
+            [KeyboardButton(text="📥 Загрузить остатки"), KeyboardButton(text="🔙 Назад")]
         ]
     )
 
-def get_order_names_keyboard(order_data: List[Tuple[str, str]], prefix: str, cancel_to: str = "") -> InlineKeyboardMarkup:
+def get_cancel_keyboard(cancel_to: str = "") -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[get_cancel_button(cancel_to)]])
+
+def get_page_row(page: OrderPage, page_prefix: str) -> list[InlineKeyboardButton]:
+    row = []
+    if page.has_prev:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"{page_prefix}:p:{page.first}"))
+    if page.has_next:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"{page_prefix}:n:{page.last}"))
+    return row
+
+def get_order_names_keyboard(order_data: List[Tuple[str, str]], prefix: str, cancel_to: str = "",
+                             nav_row: Optional[list[InlineKeyboardButton]] = None, max_in_row: int = 3) -> InlineKeyboardMarkup:
     """Create keyboard with order display names"""
     buttons = [
         InlineKeyboardButton(text=display_name, callback_data=f"{prefix}:{order_id}")
         for order_id, display_name in order_data
     ]
-    keyboard = format_inline_kb(buttons, 3)
+    keyboard = format_inline_kb(buttons, max_in_row)
+    if nav_row:
+        keyboard.append(nav_row)
     keyboard.append([get_cancel_button(cancel_to)])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def get_order_page_keyboard(page: OrderPage, prefix: str) -> InlineKeyboardMarkup:
+    return get_order_names_keyboard(page.orders, prefix, nav_row=get_page_row(page, "orders_page"))
+
+def get_batch_complete_keyboard(page: OrderPage, selected: List[str]) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(text=f"{'☑️' if order_id in selected else '⬜'} {display_name}", callback_data=f"batch_toggle:{order_id}")
+        for order_id, display_name in page.orders
+    ]
+    keyboard = format_inline_kb(buttons, 2)
+    nav_row = get_page_row(page, "batch_page")
+    if nav_row:
+        keyboard.append(nav_row)
+    if selected:
+        keyboard.append([InlineKeyboardButton(text=f"✅ Завершить выбранные ({len(selected)})", callback_data="batch_complete")])
+    keyboard.append([get_cancel_button("")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_found_orders_keyboard(page: OrderPage) -> InlineKeyboardMarkup:
+    return get_order_names_keyboard(page.orders, "found_order", nav_row=get_page_row(page, "find_page"), max_in_row=1)
+
+def get_found_order_keyboard(order_id: str) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(text="🔄 Восстановить", callback_data=f"restore_order:{order_id}"),
+        InlineKeyboardButton(text="🔙 К результатам", callback_data="find_page:c")
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=format_inline_kb(buttons, 2))
+
 def get_date_keyboard(date_options: List[Tuple[date, str]], prefix: str, cancel_to: str = "") -> InlineKeyboardMarkup:
     buttons = [
         InlineKeyboardButton(text=date_text, callback_data=f"{prefix}:{d.isoformat()}")
@@ -63,7 +109,7 @@ def get_statistics_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True,
         keyboard=[
             [KeyboardButton(text="📅 Сегодня"), KeyboardButton(text="📅 Вчера"), KeyboardButton(text="📅 Эта неделя")],
-            [KeyboardButton(text="📅 По месяцам"), KeyboardButton(text="🔙 Назад")]
+            [KeyboardButton(text="📅 По месяцам"), KeyboardButton(text="📈 Аналитика товаров"), KeyboardButton(text="🔙 Назад")]
         ]
     )
 
@@ -74,21 +120,38 @@ def get_category_keyboard(cancel_to: str = "") -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=format_inline_kb(buttons + [get_cancel_button(cancel_to)]))
 
-def get_product_keyboard(product_names: List[str], cancel_to: str = "") -> InlineKeyboardMarkup:
+def get_catalog_page_row(kind: str, cancel_to: str, page: int, total: int) -> list[InlineKeyboardButton]:
+    pages = math.ceil(total / CATALOG_PAGE_SIZE)
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"page_{kind}_{cancel_to}:{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"page_{kind}_{cancel_to}:{page + 1}"))
+    return row
+
+def get_product_keyboard(product_names: List[str], cancel_to: str = "", page: int = 0) -> InlineKeyboardMarkup:
+    start = page * CATALOG_PAGE_SIZE
     buttons = [
         InlineKeyboardButton(text=product_name, callback_data=f"product_{cancel_to}:{index}")
-        for index, product_name in enumerate(product_names)
+        for index, product_name in enumerate(product_names[start:start + CATALOG_PAGE_SIZE], start)
     ]
     keyboard = format_inline_kb(buttons)
+    page_row = get_catalog_page_row("product", cancel_to, page, len(product_names))
+    if page_row:
+        keyboard.append(page_row)
     keyboard.append(get_navigation_row("category", cancel_to))
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_attribute_keyboard(attributes: List[str], cancel_to: str = "") -> InlineKeyboardMarkup:
+def get_attribute_keyboard(attributes: List[str], cancel_to: str = "", page: int = 0) -> InlineKeyboardMarkup:
+    start = page * CATALOG_PAGE_SIZE
     buttons = [
         InlineKeyboardButton(text=attribute, callback_data=f"attribute_{cancel_to}:{index}")
-        for index, attribute in enumerate(attributes)
+        for index, attribute in enumerate(attributes[start:start + CATALOG_PAGE_SIZE], start)
     ]
     keyboard = format_inline_kb(buttons, 3)
+    page_row = get_catalog_page_row("attribute", cancel_to, page, len(attributes))
+    if page_row:
+        keyboard.append(page_row)
     keyboard.append(get_navigation_row("product", cancel_to))
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -158,10 +221,10 @@ def get_all_adjustments_keyboard(adjustments) -> InlineKeyboardMarkup:
     keyboard.append([get_back_button("order_actions")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_months_keyboard(months_data: List[Tuple[int, int, str]], cancel_to: str = "") -> InlineKeyboardMarkup:
+def get_months_keyboard(months_data: List[Tuple[int, int, str]], prefix: str = "month", cancel_to: str = "") -> InlineKeyboardMarkup:
     """Create keyboard with available months"""
     buttons = [
-        InlineKeyboardButton(text=month_name, callback_data=f"month:{year}:{month}")
+        InlineKeyboardButton(text=month_name, callback_data=f"{prefix}:{year}:{month}")
         for year, month, month_name in months_data
     ]
     keyboard = format_inline_kb(buttons, 2)
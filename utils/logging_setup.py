@@ -0,0 +1,98 @@
+import atexit, itertools, json, logging, queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Union
+
+from utils.config import CONFIG
+
+SCALARS = (str, int, float, bool, type(None))
+RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime", "taskName"}
+
+def parse_sample_rates(value: str) -> Dict[str, int]:
+    """"sheets.queue=10,aiogram.event=5" -> {"sheets.queue": 10, "aiogram.event": 5}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = max(int(rate or 1), 1)
+    return rates
+
+def format_value(value: Any) -> str:
+    if isinstance(value, (list, tuple, set)):
+        value = ",".join(map(str, value))
+    text = str(value)
+    if not text or any(char in text for char in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+class KeyValueFormatter(logging.Formatter):
+    """One line per record: time, level, logger, static fields, msg and the record's extra fields as key=value"""
+    default_time_format = "%Y-%m-%dT%H:%M:%S"
+    default_msec_format = "%s.%03d"
+
+    def __init__(self, fields: Dict[str, Any] = None):
+        super().__init__()
+        self.fields = fields or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        pairs = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 **self.fields, "msg": record.getMessage()}
+        pairs.update((key, value) for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            pairs["exc"] = record.exc_text
+        if record.stack_info:
+            pairs["stack"] = record.stack_info
+        return " ".join(f"{key}={format_value(value)}" for key, value in pairs.items())
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted so %-style arguments are merged on the listener thread.
+
+    Arguments other than plain scalars may change or belong to the loop thread (ORM objects), those are merged here"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not all(isinstance(arg, SCALARS) for arg in record.args):
+            record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Keeps one of every N records below WARNING of a subsystem logger and its children, kept records carry sampled=N"""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.counters = {name: itertools.count() for name in rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for name, rate in self.rates.items():
+            if rate > 1 and (record.name == name or record.name.startswith(name + ".")):
+                if next(self.counters[name]) % rate:
+                    return False
+                record.sampled = rate
+                return True
+        return True
+
+def setup_logging(level: Union[int, str] = CONFIG.LOG_LEVEL, sample: str = CONFIG.LOG_SAMPLE, **fields) -> QueueListener:
+    """Route all logging through a queue to a stderr writer thread, fields like worker=1 are added to every line"""
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(KeyValueFormatter(fields))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(sample)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Stopping flushes the records still queued at exit
+    atexit.register(listener.stop)
+    return listener
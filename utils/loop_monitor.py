@@ -0,0 +1,61 @@
+import asyncio, logging, sys, threading, time, traceback
+from typing import Optional
+
+from utils.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+PROBE_INTERVAL = 0.1
+STALL_THRESHOLD = 0.5
+STACK_LIMIT = 25
+
+class LoopMonitor:
+    """Measures event loop scheduling lag and dumps the loop thread stack when it stalls"""
+
+    def __init__(self, interval: float = PROBE_INTERVAL, threshold: float = STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.probe_task = None
+        self.stopped = threading.Event()
+        self.watchdog = None
+
+    def start(self):
+        """Start probing the running loop and watching it from a daemon thread"""
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.probe_task = asyncio.create_task(self._probe())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self):
+        self.stopped.set()
+        if self.probe_task:
+            self.probe_task.cancel()
+            try:
+                await self.probe_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _probe(self):
+        """Sleep for a fixed interval, any extra time before waking up is loop lag"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.heartbeat = time.monotonic()
+            LOOP_LAG_SECONDS.observe(max(0.0, self.heartbeat - started - self.interval))
+
+    def _watch(self):
+        """Log the loop thread stack once per stall, while the probe can not get scheduled"""
+        reported = None
+        while not self.stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            stalled_for = time.monotonic() - heartbeat
+            if stalled_for < self.threshold or reported == heartbeat:
+                continue
+
+            reported = heartbeat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "unavailable"
+            logging.warning(f"Event loop blocked for {stalled_for * 1000:.0f} ms, loop thread stack:\n{stack}")
@@ -0,0 +1,181 @@
+import bisect, contextvars, logging, threading, time
+from typing import Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+from utils.sql_profiler import current_profile, get_statement_shape
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class Metric:
+    """Base of a labelled metric rendered in Prometheus text format"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._render_samples()
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self.values.items()]
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, totals = self.values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def time(self, **labels) -> "Timer":
+        return Timer(self, labels)
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, totals) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {totals[0]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+class Timer:
+    """Context manager observing elapsed seconds into a histogram"""
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+REGISTRY: List[Metric] = []
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Handler latency", ["router", "handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised", ["router", "handler"])
+DB_QUERIES = Counter("bot_db_queries_total", "Executed SQL statements")
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "SQL statement duration")
+DB_QUERIES_PER_UPDATE = Histogram("bot_db_queries_per_update", "SQL statements per handled update", ["handler"], COUNT_BUCKETS)
+DB_SECONDS_PER_UPDATE = Histogram("bot_db_seconds_per_update", "Time spent in SQL per handled update", ["handler"])
+SHEETS_CALLS = Counter("bot_sheets_calls_total", "Google Sheets API calls", ["method", "status"])
+SHEETS_CALL_SECONDS = Histogram("bot_sheets_call_seconds", "Google Sheets API call latency", ["method"])
+SHEET_QUEUE_DEPTH = Gauge("bot_sheet_queue_depth", "Sheet write batches waiting in the queue")
+SHEET_QUEUE_AGE_SECONDS = Histogram("bot_sheet_queue_age_seconds", "Time a sheet write batch waited before it was written")
+SYNC_SECONDS = Histogram("bot_sync_seconds", "Duration of a full sheet sync cycle", buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120))
+SYNC_ROWS_CHANGED = Counter("bot_sync_rows_changed_total", "Products changed by sheet sync", ["change"])
+SEND_WAIT_SECONDS = Histogram("bot_send_wait_seconds", "Time outgoing requests waited for a send slot", ["priority"])
+LOOP_LAG_SECONDS = Histogram("bot_loop_lag_seconds", "Event loop scheduling lag",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Counter("bot_loop_stalls_total", "Event loop stalls longer than the watchdog threshold")
+CALLBACK_DUPLICATES = Counter("bot_callback_duplicates_dropped_total", "Duplicate callback taps dropped")
+
+class UpdateStats:
+    """SQL statements executed while handling one update"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+current_update: contextvars.ContextVar[Optional[UpdateStats]] = contextvars.ContextVar("current_update", default=None)
+
+def instrument_engine(engine):
+    """Count and time every statement, attributing it to the update being handled and its SQL profile if any"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERIES.inc()
+        DB_QUERY_SECONDS.observe(elapsed)
+
+        stats = current_update.get()
+        if stats:
+            stats.queries += 1
+            stats.seconds += elapsed
+
+        profile = current_profile.get()
+        if profile:
+            profile.queries += 1
+            profile.seconds += elapsed
+            profile.shapes[get_statement_shape(statement)] += 1
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0") -> web.AppRunner:
+    """Serve /metrics on the given port from the running event loop"""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return runner
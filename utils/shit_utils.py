@@ -1,11 +1,15 @@
 from decimal import Decimal
 from typing import Union, List, Tuple
 from datetime import datetime, timedelta, date
-import math
+import math, re
 
 from database.models import Order
 from utils.config import CONFIG
 
+def escape_markdown(text: str) -> str:
+    """Escape user text placed outside entities of a Markdown (legacy) message"""
+    return re.sub(r"([_*`\[])", r"\\\1", text)
+
 def format_price(value: Union[float, int, Decimal]) -> str:
     """Format price for Telegram message"""
     if isinstance(value, Decimal):
@@ -40,8 +44,8 @@ def format_customer_message(order) -> str:
 
     return message
 
-def format_order_msg(order: Order) -> str:
-    """Format order message for Telegram"""
+def format_order_msg(order) -> str:
+    """Format order message for Telegram from an Order or an OrderView"""
     if not order.items:
         return "Товары отсутствуют"
 
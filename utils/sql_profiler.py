@@ -0,0 +1,26 @@
+import contextvars, re
+from collections import Counter
+from typing import List, Optional, Tuple
+
+SHAPE_LENGTH = 120
+
+class SqlProfile:
+    """Statements issued while handling one update"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def get_repeated(self, min_count: int) -> List[Tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= min_count]
+
+current_profile: contextvars.ContextVar[Optional[SqlProfile]] = contextvars.ContextVar("current_profile", default=None)
+
+def get_statement_shape(statement: str) -> str:
+    """Statement with literals, parameters and IN lists collapsed so repeated queries look the same"""
+    shape = re.sub(r"%\(\w+\)s|\$\d+|:\w+|'[^']*'|\b\d+(\.\d+)?\b", "?", statement)
+    shape = re.sub(r"\(\s*\?(\s*,\s*\?)+\s*\)", "(?...)", shape)
+    shape = re.sub(r"\s+", " ", shape).strip()
+    # The column list only makes log lines long, the table and the filter identify the query
+    return re.sub(r"^SELECT .*? FROM ", "SELECT ... FROM ", shape)[:SHAPE_LENGTH]
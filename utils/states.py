@@ -9,7 +9,13 @@ class OrderStates(StatesGroup):
     ENTER_ADJUSTMENT_AMOUNT = State()
     ENTER_ADJUSTMENT_REASON = State()
     ENTER_ORDER_NAME = State()
+    ENTER_SEARCH_QUERY = State()
+
+class ProductStates(StatesGroup):
+    """States for product operations"""
+    UPLOAD_STOCK_FILE = State()
 
 class StatisticsStates(StatesGroup):
     """States for the sale statistics"""
     SELECT_PERIOD = State()
+    SELECT_ANALYTICS_PERIOD = State()
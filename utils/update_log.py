@@ -0,0 +1,118 @@
+import gzip, hashlib, json, logging, os, re, time
+from typing import Any, Dict, List, Optional
+from aiogram.types import Update
+
+# Quantities and amounts only, longer digit strings like phone numbers are digested as free text
+NUMBER_PATTERN = re.compile(r"^\d{1,6}([.,]\d{1,2})?$")
+FLUSH_EVERY = 100
+FLUSH_INTERVAL = 5
+
+def get_menu_texts() -> set:
+    """Texts of the reply keyboard buttons, they carry no customer data and drive the handlers on replay"""
+    from utils.keyboards import get_main_menu, get_orders_menu, get_products_menu, get_statistics_keyboard
+    return {
+        button.text
+        for keyboard in (get_main_menu(), get_orders_menu(), get_products_menu(), get_statistics_keyboard())
+        for row in keyboard.keyboard for button in row
+    }
+
+def find_button(markup: Any, data: str) -> Optional[List[int]]:
+    """Position of the inline button with given callback data, ids inside the data differ on replay but positions do not"""
+    for row_index, row in enumerate(getattr(markup, "inline_keyboard", None) or []):
+        for col_index, button in enumerate(row):
+            if button.callback_data == data:
+                return [row_index, col_index]
+    return None
+
+class Anonymizer:
+    """Replaces user and chat ids with sequential pseudonyms and free text with salted digests"""
+
+    def __init__(self):
+        self.salt = os.urandom(16)
+        self.ids: Dict[int, int] = {}
+        self.menu_texts = get_menu_texts()
+
+    def get_id(self, real_id: int) -> int:
+        return self.ids.setdefault(real_id, len(self.ids) + 1)
+
+    def get_text(self, text: Optional[str]) -> Optional[str]:
+        """Keep menu buttons, commands and amounts, the same free text always gets the same digest"""
+        if text is None or text in self.menu_texts or text.startswith("/") or NUMBER_PATTERN.match(text.strip()):
+            return text
+        return "txt-" + hashlib.blake2b(text.encode(), key=self.salt, digest_size=4).hexdigest()
+
+    def get_user(self, user: Any) -> Dict[str, Any]:
+        return {"id": self.get_id(user.id), "is_bot": False, "first_name": "User"}
+
+    def get_chat(self, chat: Any) -> Dict[str, Any]:
+        return {"id": self.get_id(chat.id), "type": chat.type}
+
+    def get_update(self, update: Update) -> Optional[Dict[str, Any]]:
+        """Allowlisted fields of a message, callback or inline query update"""
+        if update.message and update.message.from_user:
+            message = update.message
+            return {"update_id": update.update_id, "message": {
+                "message_id": message.message_id, "date": int(message.date.timestamp()), "chat": self.get_chat(message.chat),
+                "from": self.get_user(message.from_user), "text": self.get_text(message.text)
+            }}
+
+        if update.callback_query:
+            callback = update.callback_query
+            payload = {"id": str(update.update_id), "from": self.get_user(callback.from_user), "chat_instance": "0", "data": callback.data}
+            if callback.message:
+                payload["message"] = {"message_id": callback.message.message_id, "date": int(callback.message.date.timestamp()),
+                                      "chat": self.get_chat(callback.message.chat)}
+            return {"update_id": update.update_id, "callback_query": payload,
+                    "button": find_button(getattr(callback.message, "reply_markup", None), callback.data)}
+
+        if update.inline_query:
+            query = update.inline_query
+            return {"update_id": update.update_id, "inline_query": {
+                "id": str(update.update_id), "from": self.get_user(query.from_user), "query": self.get_text(query.query), "offset": ""
+            }}
+        return None
+
+class UpdateLogWriter:
+    """Appends anonymized updates with their arrival time and handling time to a gzip JSONL file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.anonymizer = Anonymizer()
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+        logging.info(f"Recording updates to {path}")
+
+    def write(self, update: Update, arrived: float, seconds: float):
+        record = self.anonymizer.get_update(update)
+        if not record:
+            return
+
+        record["t"] = round(arrived, 4)
+        record["ms"] = round(seconds * 1000, 2)
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.pending += 1
+        # A gzip flush ends a deflate block, so flush in batches; a crash loses at most the unflushed tail
+        if self.pending >= FLUSH_EVERY or time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.pending, self.flushed_at = 0, time.monotonic()
+
+    def close(self):
+        self.file.close()
+
+def get_worker_log_path(path: str, index: int) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f"worker{index}-{name}")
+
+def read_update_log(path: str) -> List[Dict[str, Any]]:
+    """Records in arrival order, a log cut short by a crash is read up to its last complete line"""
+    records = []
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                if line.endswith("\n"):
+                    records.append(json.loads(line))
+        except EOFError:
+            pass
+    # Records are written when handling finishes, so concurrent updates are not in arrival order
+    return sorted(records, key=lambda record: record["t"])